@@ -1,16 +1,28 @@
 #!/usr/bin/env python3
 
 import argparse
+import atexit
+import bisect
 import calendar
-import codecs
+import collections
+import contextlib
 import csv
+import functools
 import getpass
+import gzip
+import http.client
 import io
+import itertools
+import json
 import os
 import smtplib
+import sqlite3
 import sys
+import threading
 import time
+import urllib.parse
 import xmlrpc.client
+from concurrent.futures import Future, ThreadPoolExecutor
 from configparser import ConfigParser
 from datetime import datetime, date, timedelta
 from email import encoders
@@ -24,43 +36,272 @@ from string import Template
 from dotenv import load_dotenv
 
 
-def memoize(func):
-    func_name = func.__name__
-    data = {}
+MEMO_SIZE = 1024
+MEMO_TTL = float(os.environ.get('ODOOCLI_MEMO_TTL') or 60)
+STORE_SIZE = int(os.environ.get('ODOOCLI_STORE_SIZE') or 100000)
 
-    def wrappeada(login, month=None, year=None):
+memo_caches = []
+memo_frozen = None
+
+
+def memo_clock():
+    """
+    Reloj de las caducidades: mientras dura un informe (memo_snapshot) está
+    parado, para que no caduque nada a medias
+    """
+    if memo_frozen is not None:
+        return memo_frozen
+    return time.monotonic()
+
+
+@contextlib.contextmanager
+def memo_snapshot():
+    """
+    Para el reloj de las caducidades mientras dura el bloque (si no estaba
+    ya parado): un informe usa los mismos datos de principio a fin
+    """
+    global memo_frozen
+    if memo_frozen is not None:
+        yield
+        return
+    memo_frozen = time.monotonic()
+    try:
+        yield
+    finally:
+        memo_frozen = None
+
+
+class MemoCache:
+    """
+    Caché en memoria con como mucho maxsize entradas (al superarlo se
+    descartan las usadas hace más tiempo) y tiempo de caducidad por entrada.
+    Las claves empiezan por (base de datos, usuario o empleado), para poder
+    descartar las de uno con drop_user.
+    Se usa con get/put (memoize) o como un dict; en ese caso las entradas
+    para las que current(key) es cierto caducan a los ttl segundos.
+    """
+
+    def __init__(self, name, maxsize, ttl=None, current=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.current = current
+        self.lock = threading.RLock()
+        self.data = collections.OrderedDict()
+        self.scopes = {}
+        self.hits = self.misses = self.expired = self.evicted = 0
+        memo_caches.append(self)
+
+    def get(self, key):
+        """
+        Retorna (estado, valor), donde estado es 'hit', 'expired' o 'miss'
+        """
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None:
+                self.misses += 1
+                return 'miss', None
+            value, expires = entry
+            if expires is not None and expires <= memo_clock():
+                self.remove(key)
+                self.expired += 1
+                return 'expired', None
+            self.data.move_to_end(key)
+            self.hits += 1
+            return 'hit', value
+
+    def put(self, key, value, ttl=None):
+        with self.lock:
+            if key not in self.data:
+                self.scopes.setdefault(key[:2], set()).add(key)
+            self.data[key] = (value,
+                              None if ttl is None else memo_clock() + ttl)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.remove(next(iter(self.data)))
+                self.evicted += 1
+
+    def remove(self, key):
+        del self.data[key]
+        scope = self.scopes[key[:2]]
+        scope.discard(key)
+        if not scope:
+            del self.scopes[key[:2]]
+
+    def drop_user(self, db, user):
+        with self.lock:
+            for key in list(self.scopes.get((db, user), ())):
+                self.remove(key)
+
+    def __contains__(self, key):
+        return self.get(key)[0] == 'hit'
+
+    def __getitem__(self, key):
+        # Sin mirar la caducidad: se usa justo después de comprobar (in) o
+        # cargar la entrada
+        with self.lock:
+            return self.data[key][0]
+
+    def __setitem__(self, key, value):
+        self.put(key, value,
+                 self.ttl if self.current and self.current(key) else None)
+
+    def update(self, items):
+        if isinstance(items, dict):
+            items = items.items()
+        for key, value in items:
+            self[key] = value
+
+    def pop(self, key, default=None):
+        with self.lock:
+            if key not in self.data:
+                return default
+            value = self.data[key][0]
+            self.remove(key)
+            return value
+
+
+def current_month_key(key):
+    """
+    Indica si una clave (..., año, mes) es del mes en curso o posterior
+    """
+    now = clock_now()
+    return (key[-2], key[-1]) >= (now.year, now.month)
+
+
+def current_year_key(key):
+    """
+    Indica si una clave (..., año) es del año en curso o posterior
+    """
+    return key[-1] >= clock_now().year
+
+
+def memo_user(login):
+    if 'user_email' in login:
+        return login['user_email']
+    return login['username']
 
+
+def memoize(func=None, maxsize=MEMO_SIZE, ttl=MEMO_TTL):
+    """
+    Memoiza func(login, month, year) por base de datos, usuario, mes y año,
+    con como mucho maxsize entradas. Las del mes en curso (o posteriores)
+    caducan a los ttl segundos; las de meses cerrados no caducan.
+    Se puede usar como @memoize o @memoize(maxsize=...).
+    """
+    if func is None:
+        return lambda func: memoize(func, maxsize, ttl)
+    cache = MemoCache(func.__name__, maxsize)
+
+    def wrappeada(login, month=None, year=None):
+        now = get_now(login)
         if year is None:
-            year = int(datetime.now().year)
+            year = int(now.year)
         if month is None:
-            month = int(datetime.now().month)
+            month = int(now.month)
+
+        key = (login['db'], memo_user(login), month, year)
+        state, value = cache.get(key)
+        if state == 'hit':
+            return value
+        value = func(login, month, year)
+        cache.put(key, value,
+                  ttl if (year, month) >= (now.year, now.month) else None)
+        return value
+
+    wrappeada.cache = cache
+    return wrappeada
 
-        if 'user_email' in login:
-            user = login['user_email']
-        else:
-            user = login['username']
 
-        dict_key = "{}-{}-{}-{}".format(func_name, user, month, year)
+def memo_drop_user(login):
+    """
+    Descarta todo lo guardado en memoria para el usuario de login: lo
+    memoizado (por usuario) y sus datos cargados (por empleado)
+    """
+    employee = get_employee(login)
+    for cache in memo_caches:
+        cache.drop_user(login['db'], memo_user(login))
+        if employee:
+            cache.drop_user(login['db'], employee.id)
+
 
-        if dict_key in data:
-            return data[dict_key]
-        else:
-            data[dict_key] = list(func(login, month, year))
-            return data[dict_key]
+def memo_report(out):
+    """
+    Muestra los aciertos, fallos, entradas caducadas y descartadas y el
+    tamaño de cada caché en memoria
+    """
+    print('\nAciertos | Fallos   | Caducadas | Descartadas | Entradas | '
+          'Caché en memoria', file=out)
+    for cache in memo_caches:
+        print('{:8} | {:8} | {:9} | {:11} | {:8} | {}'.format(
+            cache.hits, cache.misses, cache.expired, cache.evicted,
+            len(cache.data), cache.name), file=out)
+
+
+class ReportNow:
+    """
+    El "ahora" de un informe: el instante en que empezó y la sesión abierta
+    hoy por el usuario (session: None si aún no se ha buscado, False si no
+    hay). Así todas las cifras de un informe usan el mismo momento y la
+    sesión abierta se busca una sola vez.
+    """
+    __slots__ = ('moment', 'session')
+
+    def __init__(self):
+        self.moment = clock_now()
+        self.session = None
+
+
+def report(func):
+    """
+    Decorador para las funciones de informe: si login no trae ya el "ahora"
+    de un informe (login['now']) se crea uno para esta llamada, que pasa a
+    las funciones que llame a través de login. Mientras dura el informe no
+    caduca nada en las cachés en memoria (memo_snapshot).
+    """
+    @functools.wraps(func)
+    def wrappeada(login, *args, **kwargs):
+        if 'now' not in login:
+            login = dict(login, now=ReportNow())
+        with memo_snapshot():
+            return func(login, *args, **kwargs)
 
     return wrappeada
 
 
+def get_now(login):
+    """
+    Instante del informe en curso, o el actual si no hay informe
+    """
+    now = login.get('now')
+    if now is None:
+        return clock_now()
+    return now.moment
+
+
+def clock_now():
+    """
+    Hora actual. Al grabar o reproducir un cassette es siempre la del
+    inicio de la grabación, para que los informes reproducidos (sesiones
+    abiertas, mes por defecto...) salgan igual que al grabarlos
+    """
+    if rpc_cassette is not None:
+        return rpc_cassette.now
+    return datetime.now()
+
+
+@report
 def show_resume_now(login, month=None, year=None):
     """
     Informe del mes corriente:
     """
     if year is None:
-        year = int(datetime.now().year)
+        year = int(get_now(login).year)
     if month is None:
-        month = int(datetime.now().month)
+        month = int(get_now(login).month)
 
-    working_hours_to_today = get_mountly_hours_from_calendar_name(login)
+    profile = get_employee_profile(login)
+    working_hours_to_today = profile.monthly_hours
 
     if working_hours_to_today:
         # En lugar de horario, lo que tiene es un número de horas mensuales
@@ -69,7 +310,7 @@ def show_resume_now(login, month=None, year=None):
         w_hours = count_worked_hours(login)
 
     else:
-        working_hours_to_today = get_total_hours_from_calendar_name(login)
+        working_hours_to_today = profile.total_hours
         # En este if haría falta un walrus
         if working_hours_to_today:
             # En lugar de horario, lo que tiene es un número de horas totales
@@ -81,7 +322,7 @@ def show_resume_now(login, month=None, year=None):
         w_hours = count_worked_hours(login)
         dict_labor_hours_this_month = labor_hours_by_month_day(login, month, year)
 
-        today = datetime.now().strftime('%Y-%m-%d')
+        today = get_now(login).strftime('%Y-%m-%d')
 
         working_days_total = 0
         working_hours_total = 0
@@ -108,35 +349,38 @@ def show_resume_now(login, month=None, year=None):
         format_hours(w_hours - working_hours_to_today)))
 
 
+@report
 def show_resume(login, month=None, year=None):
     """
     Informe del mes pasado como argumento:
     """
     if year is None:
-        year = int(datetime.now().year)
+        year = int(get_now(login).year)
     if month is None:
-        month = int(datetime.now().month)
+        month = int(get_now(login).month)
     print("{} {}\n".format(mes(month), year))
     print(resume_to_string(login, month, year))
 
 
+@report
 def resume_to_string(login, month=None, year=None):
     """
     Informe del mes pasado como argumento:
     """
     if year is None:
-        year = int(datetime.now().year)
+        year = int(get_now(login).year)
     if month is None:
-        month = int(datetime.now().month)
+        month = int(get_now(login).month)
 
-    working_hours_total = get_mountly_hours_from_calendar_name(login)
+    profile = get_employee_profile(login)
+    working_hours_total = profile.monthly_hours
 
     if working_hours_total:
         w_hours = count_worked_hours(login, month, year)
         working_days_total = "--"
 
     else:
-        working_hours_total = get_total_hours_from_calendar_name(login)
+        working_hours_total = profile.total_hours
         # En este if haría falta un walrus
         if working_hours_total:
             # En lugar de horario, lo que tiene es un número de horas totales
@@ -164,15 +408,16 @@ def resume_to_string(login, month=None, year=None):
     return response
 
 
+@report
 def year_summary(login, month=None, year=None):
     """
     resumen desde enero hasta el mes indicado
     """
 
     if year is None:
-        year = int(datetime.now().year)
+        year = int(get_now(login).year)
     if month is None:
-        month = int(datetime.now().month)
+        month = int(get_now(login).month)
 
     prev_mont = month - 1
     prev_year = year
@@ -180,23 +425,26 @@ def year_summary(login, month=None, year=None):
         prev_mont = 12
         prev_year -= 1
 
+    prefetch_year_attendance(login, month, year)
     show_resume_now(login, month, year)
     print('\n')
     print(accumulated_summary(login, prev_mont, prev_year))
 
 
+@report
 def accumulated_summary(login, month=None, year=None):
     """
     resumen desde enero hasta el mes indicado
     """
     if year is None:
-        year = int(datetime.now().year)
+        year = int(get_now(login).year)
     if month is None:
-        month = int(datetime.now().month)
+        month = int(get_now(login).month)
 
     labor_hours = 0
     worked_hours = 0
 
+    prefetch_year_attendance(login, month, year)
     for m in range(1, month + 1):
         labor_hours += sum(labor_hours_by_month_day(login, m, year).values())
         worked_hours += count_worked_hours(login, m, year)
@@ -209,70 +457,104 @@ def accumulated_summary(login, month=None, year=None):
     return response
 
 
+@report
 def show_today_summary(login):
     l_hours = count_worked_hours_today(login)
     print("Horas trabajadas hoy:\t{}\n".format(format_hours(l_hours)))
 
 
+@report
 def accumulated_list_to_csv(login, file_name, month=None, year=None):
+    """
+    Guarda el resumen del mes y el listado de asistencias desde enero.
+    Las asistencias se escriben según llegan (ver list_to_csv).
+    """
+    if year is None:
+        year = int(get_now(login).year)
+    if month is None:
+        month = int(get_now(login).month)
     file_path = filename(login, file_name)
 
     summary = resume_to_string(login, month, year)
-    csv_string = accumulated_list_to_csv_string(login, month, year)
-    with codecs.open(file_path, 'w', 'utf-8') as out:
+    with open_report(file_path) as out:
         print(summary, file=out)
-        print(csv_string, file=out)
+        write_attendance_csv(out, login, range(1, month + 1), year)
+        print(file=out)
 
 
+@report
 def accumulated_list_to_csv_string(login, month=None, year=None):
     """
     listado desde enero hasta el mes indicado
     """
     if year is None:
-        year = int(datetime.now().year)
+        year = int(get_now(login).year)
     if month is None:
-        month = int(datetime.now().month)
+        month = int(get_now(login).month)
 
     mem_file = io.StringIO()
-    csv_writer = csv.writer(mem_file, delimiter=',', quotechar='"')
-    csv_writer.writerow(('entrada', 'salida', 'horas'))
-
-    for m in range(1, month + 1):
-        for line in get_user_attendance_by_month(login, m, year):
-            tentry = tlocal(line[0], 'DT')
-            texit = tlocal(line[1], 'DT')
-            if line[1]:
-                hours = line[2]
-            else:
-                hours = open_session_worked_hours(login)
-            csv_writer.writerow(
-                (tentry, texit, '{}'.format(format_hours(hours))))
+    prefetch_year_attendance(login, month, year)
+    write_attendance_csv(mem_file, login, range(1, month + 1), year)
     return mem_file.getvalue()
 
 
+@report
 def list_to_csv(login, file_name, month=None, year=None):
+    """
+    Guarda el resumen del mes y el listado de asistencias en formato CSV.
+    Las asistencias se escriben en el archivo según llegan de Odoo, sin
+    montar antes el CSV en memoria. Si el nombre termina en .gz el archivo
+    se comprime con gzip.
+    """
+    if year is None:
+        year = int(get_now(login).year)
+    if month is None:
+        month = int(get_now(login).month)
     file_path = filename(login, file_name)
 
     summary = resume_to_string(login, month, year)
-    csv_string = list_to_csv_string(login, month, year)
-    with codecs.open(file_path, 'w', 'utf-8') as out:
+    with open_report(file_path) as out:
         print(summary, file=out)
-        print(csv_string, file=out)
+        write_attendance_csv(out, login, [month], year)
+        print(file=out)
 
 
+@report
 def list_to_csv_string(login, month=None, year=None):
+    if year is None:
+        year = int(get_now(login).year)
+    if month is None:
+        month = int(get_now(login).month)
     mem_file = io.StringIO()
-    csv_writer = csv.writer(mem_file, delimiter=',', quotechar='"')
+    write_attendance_csv(mem_file, login, [month], year)
+    return mem_file.getvalue()
+
+
+def write_attendance_csv(out, login, months, year):
+    """
+    Escribe en out el listado de asistencias de los meses indicados en
+    formato CSV, fila a fila
+    """
+    csv_writer = csv.writer(out, delimiter=',', quotechar='"')
     csv_writer.writerow(('entrada', 'salida', 'horas'))
-    for line in get_user_attendance_by_month(login, month, year):
-        tentry = tlocal(line[0], 'DT')
-        texit = tlocal(line[1], 'DT')
-        if line[1]:
-            hours = line[2]
+    for line in attendance_by_months(login, months, year):
+        tentry = txt_local(line.local_in, 'DT')
+        texit = txt_local(line.local_out, 'DT')
+        if line.check_out:
+            hours = line.worked_hours
         else:
             hours = open_session_worked_hours(login)
         csv_writer.writerow((tentry, texit, '{}'.format(format_hours(hours))))
-    return mem_file.getvalue()
+
+
+def open_report(file_path):
+    """
+    Abre para escribir el archivo de un informe; si el nombre termina en .gz
+    se comprime con gzip
+    """
+    if str(file_path).endswith('.gz'):
+        return gzip.open(file_path, 'wt', encoding='utf-8', newline='')
+    return open(file_path, 'w', encoding='utf-8', newline='')
 
 
 def filename(login, path):
@@ -292,11 +574,12 @@ def mail_report_list(login, month=None, year=None):
     mail_report(login, 'list', month, year)
 
 
+@report
 def mail_report(login, mode='list', month=None, year=None):
     if year is None:
-        year = int(datetime.now().year)
+        year = int(get_now(login).year)
     if month is None:
-        month = int(datetime.now().month)
+        month = int(get_now(login).month)
     if 'user_email' in login:
         mail_to = login['user_email']
     else:
@@ -311,6 +594,7 @@ def mail_report(login, mode='list', month=None, year=None):
         if prev_mont == 0:
             prev_mont = 12
             prev_year -= 1
+        prefetch_year_attendance(login, month, year)
         past_summary = accumulated_summary(login, prev_mont, prev_year)
         current_summary = resume_to_string(login, month, year)
         summary = '{}\n\n{}'.format(current_summary, past_summary)
@@ -346,25 +630,121 @@ def mail_report(login, mode='list', month=None, year=None):
     send_mail(mail_to, subject, body_text, file_name, file_content)
 
 
+@report
 def list_to_screen(login, month=None, year=None):
     print("Fecha      | Entrada  | Salida   | Horas")
 
     for line in get_user_attendance_by_month(login, month, year):
 
-        if line[1]:
+        if line.check_out:
             print('{} | {} | {} | {}'.format(
-                tlocal(line[0], 'D'),
-                tlocal(line[0], 'T'),
-                tlocal(line[1], 'T'),
-                format_hours(line[2])))
+                txt_local(line.local_in, 'D'),
+                txt_local(line.local_in, 'T'),
+                txt_local(line.local_out, 'T'),
+                format_hours(line.worked_hours)))
         else:
             print('{} | {} | {} | {}'.format(
-                tlocal(line[0], 'D'),
-                tlocal(line[0], 'T'),
-                tlocal(line[1], 'T'),
+                txt_local(line.local_in, 'D'),
+                txt_local(line.local_in, 'T'),
+                txt_local(line.local_out, 'T'),
                 format_hours(open_session_worked_hours(login))))
 
 
+@report
+def org_summary_rows(login, mails=None, month=None, year=None,
+                     accumulated=False):
+    """
+    Resumen de todos los usuarios de mails (de todos si no se indican), con
+    una fila por usuario y mes: (email, "AAAA-MM", días laborables, horas
+    laborables, horas trabajadas). Si accumulated, desde enero.
+    Las horas trabajadas salen de un solo read_group por empleado y mes, y
+    las laborables del calendario compartido. Las sesiones abiertas no se
+    cuentan. Se omiten los usuarios sin ninguna asistencia.
+    """
+    if year is None:
+        year = int(get_now(login).year)
+    if month is None:
+        month = int(get_now(login).month)
+    everybody = not mails
+    if everybody:
+        mails = get_mail_users(login)
+    index = get_employees_index(login)
+    users = [(mail, index['employees'].get(index['by_email'].get(mail)))
+             for mail in mails]
+    users = [(mail, profile) for mail, profile in users if profile]
+    employee_ids = [profile.id for mail, profile in users]
+    month_from = 1 if accumulated else month
+
+    load_life_hours(login, employee_ids, month, year)
+    load_calendar_weeks(login, [profile.calendar_id
+                                for mail, profile in users])
+    load_leaves(login, employee_ids, year)
+    next_year, next_month = divmod(month, 12)
+    period = [('check_in', '>=', '{}-{:02d}-01 00:00:00'.format(year,
+                                                               month_from)),
+              ('check_in', '<', '{}-{:02d}-01 00:00:00'.format(
+                  year + next_year, next_month + 1))]
+    if everybody:
+        # Sin filtrar por empleado: una sola consulta y grupos más pequeños
+        worked = worked_hours_groups(login, period, by_month=True)
+    else:
+        worked = {}
+        for chunk in range(0, len(employee_ids), ATTENDANCE_CHUNK):
+            worked.update(worked_hours_groups(
+                login, [('employee_id', 'in',
+                         employee_ids[chunk:chunk + ATTENDANCE_CHUNK])] +
+                period, by_month=True))
+
+    for mail, profile in users:
+        if not life_hours[(login['db'], profile.id, year, month)][1]:
+            continue
+        user_login = dict(login)
+        user_login['user_email'] = mail
+        months = ['{}-{:02d}'.format(year, m)
+                  for m in range(month_from, month + 1)]
+        hours = [worked.get((profile.id, m), (0, 0))[0] for m in months]
+        # Las horas de toda la vida hasta cada mes salen de las de hasta el
+        # último mes menos las de los meses posteriores
+        life = life_hours[(login['db'], profile.id, year, month)][0]
+        for m, month_period in enumerate(months):
+            if profile.monthly_hours:
+                yield mail, month_period, '--', profile.monthly_hours, hours[m]
+            elif profile.total_hours:
+                yield (mail, month_period, '--', profile.total_hours,
+                       life - sum(hours[m + 1:]))
+            else:
+                labor = [h for h in labor_hours_by_month_day(
+                    user_login, month_from + m, year).values() if h > 0]
+                yield mail, month_period, len(labor), sum(labor), hours[m]
+
+
+@report
+def org_summary_to_screen(login, mails=None, month=None, year=None,
+                          accumulated=False):
+    rows = list(org_summary_rows(login, mails, month, year, accumulated))
+    width = max([len('Usuario')] + [len(row[0]) for row in rows])
+    print('{:{}} | Mes     | Días | Laborables  | Trabajadas  | Diferencia'
+          .format('Usuario', width))
+    for mail, period, days, labor, worked in rows:
+        print('{:{}} | {} | {:>4} | {:>11} | {:>11} | {:>11}'.format(
+            mail, width, period, days, format_hours(labor),
+            format_hours(worked), format_hours(worked - labor)))
+
+
+@report
+def org_summary_to_csv(login, file_name, mails=None, month=None, year=None,
+                       accumulated=False):
+    with open_report(file_name) as out:
+        csv_writer = csv.writer(out, delimiter=',', quotechar='"')
+        csv_writer.writerow(('usuario', 'mes', 'dias', 'laborables',
+                             'trabajadas', 'diferencia'))
+        for mail, period, days, labor, worked in org_summary_rows(
+                login, mails, month, year, accumulated):
+            csv_writer.writerow((mail, period, days, format_hours(labor),
+                                 format_hours(worked),
+                                 format_hours(worked - labor)))
+
+
 ########################################################################
 #
 # Holidays, weekends and vacations
@@ -372,11 +752,39 @@ def list_to_screen(login, month=None, year=None):
 ########################################################################
 
 
-def public_holidays(login, year):
+holidays_tables = MemoCache('holidays_tables', 64, MEMO_TTL,
+                            current_year_key)
+
+
+def get_holidays_table(login, year):
+    """
+    Tabla de festivos de un año, indexada por provincia (state_ids) y
+    ordenada por fecha. Los festivos nacionales se guardan con la provincia
+    None.
+    Se carga una sola vez por año (dos RPC) y la comparten todos los meses y
+    todos los empleados.
+    """
+    key = (login['db'], year)
+    if key not in holidays_tables:
+        lines = disk_cache_get(login, 'hr.holidays.public.line', 0, year)
+        if lines is None:
+            lines = fetch_holiday_lines(login, year)
+            disk_cache_put(login, 'hr.holidays.public.line', 0, year, lines)
+            sync_record_loaded(login, 'hr.holidays.public.line', [0], lines)
+            disk_cache_commit()
+        lines.sort(key=lambda line: line['date'])
+        table = {'by_state': {}}
+        for line in lines:
+            for state in line['state_ids'] or [None]:
+                table['by_state'].setdefault(state, []).append(line)
+        holidays_tables[key] = table
+    return holidays_tables[key]
+
+
+def fetch_holiday_lines(login, year):
     """
-    Festivos de un año nacionales y provinciales
+    Descarga las líneas de festivos (hr.holidays.public.line) de un año
     """
-    user_city = get_state_by_address(login, get_address_id_employee(login))
     holidays = login['conn'].execute_kw(
         login['db'],
         login['uid'],
@@ -385,72 +793,142 @@ def public_holidays(login, year):
         'search_read',
         [[('year', '=', year)]],
         {'fields': ['line_ids']})
-    for i in holidays[0]['line_ids']:
-        hly = get_holiday(login, i)
-        if not hly["state_ids"] or user_city in hly["state_ids"]:
-            yield get_holiday(login, i)
-
-
-def get_holiday(login, id_holiday):
-    holidays = login['conn'].execute_kw(
+    line_ids = [i for holiday in holidays for i in holiday['line_ids']]
+    if not line_ids:
+        return []
+    return login['conn'].execute_kw(
         login['db'],
         login['uid'],
         login['password'],
         'hr.holidays.public.line',
-        'search_read',
-        [[('id', '=', id_holiday)]],
-        {})
-    return holidays[0]
+        'read',
+        [line_ids],
+        {'fields': ['name', 'date', 'state_ids', 'write_date']})
 
 
-@memoize
-def holidays_by_month(login, month=None, year=None):
-    """
-    Listado de festivos
-    """
-    if year is None:
-        year = int(datetime.now().year)
-    if month is None:
-        month = int(datetime.now().month)
-    for day in public_holidays(login, year):
-        if int(day['date'].split('-')[1]) == month:
-            yield day['date']
+leaves_cache = MemoCache('leaves', STORE_SIZE, MEMO_TTL, current_year_key)
 
 
-@memoize
-def get_vacances_by_month(login, month=None, year=None):
+def load_leaves(login, employee_ids, year):
     """
-    Listado de días de vacaciones
+    Carga con una sola consulta las ausencias (hr.holidays) de un año de
+    varios empleados y las guarda por (empleado, año) como
+    (date_from, date_to, días). En la caché local se guarda también el id.
+    El filtrado por empleado, fechas y estado se hace en el servidor.
     """
-    user_id = get_user_id(login)
-    if year is None:
-        year = int(datetime.now().year)
-    if month is None:
-        month = int(datetime.now().month)
-
-    vacances = login['conn'].execute_kw(
+    pending = [i for i in employee_ids
+               if i and (login['db'], i, year) not in leaves_cache]
+    for employee_id in list(pending):
+        leaves = disk_cache_get(login, 'hr.holidays', employee_id, year)
+        # Las entradas antiguas de la caché no tienen los días ni el id
+        if leaves is not None and all(len(leave) == 4 for leave in leaves):
+            leaves_cache[(login['db'], employee_id, year)] = \
+                [tuple(leave[:3]) for leave in leaves]
+            pending.remove(employee_id)
+    if not pending:
+        return
+    # Las fechas están en UTC: se amplía un día por cada lado y el
+    # recorte fino se hace después en hora local
+    leaves = login['conn'].execute_kw(
         login['db'],
         login['uid'],
         login['password'],
         'hr.holidays',
         'search_read',
-        [[]],
-        {})
-    for i in vacances:
-        if i['employee_id'] and i['employee_id'][0] == user_id:
-            if i['date_from'] and i['date_to'] and i['state'] != 'refuse':
-                d_init = str_to_localtime(i['date_from'])
-                d_end = str_to_localtime(i['date_to'])
-                if d_init.tm_year == year or d_end.tm_year == year:
-                    sdate = date(*d_init[:3])
-                    edate = date(*d_end[:3])
-                    delta = edate - sdate
-                    for inc in range(delta.days + 1):
-                        day = sdate + timedelta(days=inc)
-                        if day.year == year and day.month == month:
-                            yield "{}-{:02d}-{:02d}".format(day.year,
-                                                            day.month,
-                                                            day.day)
+        [[('employee_id', 'in', pending),
+          ('state', '!=', 'refuse'),
+          ('date_from', '<=', '{}-01-01 23:59:59'.format(year + 1)),
+          ('date_to', '>=', '{}-12-31 00:00:00'.format(year - 1))]],
+        {'fields': ['employee_id', 'date_from', 'date_to',
+                    'number_of_days_temp', 'write_date']})
+    loaded = {(login['db'], i, year): [] for i in pending}
+    for leave in leaves:
+        if leave['employee_id'] and leave['date_from'] and leave['date_to']:
+            key = (login['db'], leave['employee_id'][0], year)
+            if key in loaded:
+                loaded[key].append(sync_row('hr.holidays', leave))
+    leaves_cache.update((key, [tuple(leave[:3]) for leave in rows])
+                        for key, rows in loaded.items())
+    for (db, employee_id, year), rows in loaded.items():
+        disk_cache_put(login, 'hr.holidays', employee_id, year, rows)
+    sync_record_loaded(login, 'hr.holidays', pending, leaves)
+    disk_cache_commit()
+
+
+def get_leaves(login, employee_id, year):
+    """
+    Ausencias (date_from, date_to, días) de un empleado que tocan el año
+    indicado
+    """
+    if not employee_id:
+        return []
+    load_leaves(login, [employee_id], year)
+    return leaves_cache[(login['db'], employee_id, year)]
+
+
+leave_intervals_cache = MemoCache('leave_intervals', STORE_SIZE, MEMO_TTL,
+                                  current_year_key)
+
+
+def get_leave_intervals(login, employee_id, year):
+    """
+    Ausencias de un empleado que tocan el año, en hora local, como
+    intervalos (inicio, fin, días completos) ordenados y fusionados si se
+    solapan. Una ausencia es de días completos si Odoo le cuenta uno o más
+    días (number_of_days_temp), aunque dure menos de la jornada.
+    Retorna los intervalos y la lista de sus finales (para bisect).
+    """
+    key = (login['db'], employee_id, year)
+    if key not in leave_intervals_cache:
+        merged = []
+        for start, end, whole in sorted(
+                (local_datetime(date_from), local_datetime(date_to),
+                 days >= 1)
+                for date_from, date_to, days
+                in get_leaves(login, employee_id, year)):
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(end, merged[-1][1]),
+                              whole or merged[-1][2])
+            else:
+                merged.append((start, end, whole))
+        leave_intervals_cache[key] = (merged,
+                                      [end for start, end, whole in merged])
+    return leave_intervals_cache[key]
+
+
+def leaves_between(login, employee_id, start, end):
+    """
+    Intervalos de ausencia del empleado que se solapan con [start, end)
+    """
+    intervals, ends = get_leave_intervals(login, employee_id, start.year)
+    i = bisect.bisect_right(ends, start)
+    while i < len(intervals) and intervals[i][0] < end:
+        yield intervals[i]
+        i += 1
+
+
+def apply_leaves(login, employee_id, labor_hours_by_day, start, end):
+    """
+    Aplica sobre las horas laborables por día ({"AAAA-MM-DD": horas}) las
+    ausencias del empleado entre start y end. Una ausencia de uno o más
+    días anula todos los días que toca; una de parte de un día resta su
+    duración a las horas de ese día.
+    """
+    for leave_from, leave_to, whole in leaves_between(login, employee_id,
+                                                      start, end):
+        last = (leave_to - timedelta(microseconds=1)).date()
+        if not whole and leave_from.date() == last:
+            day = last.strftime('%Y-%m-%d')
+            if day in labor_hours_by_day:
+                labor_hours_by_day[day] = max(
+                    0, labor_hours_by_day[day] -
+                    (leave_to - leave_from).total_seconds() / 3600)
+            continue
+        day = max(leave_from.date(), start.date())
+        last = min(last, (end - timedelta(microseconds=1)).date())
+        while day <= last:
+            labor_hours_by_day[day.strftime('%Y-%m-%d')] = 0
+            day += timedelta(days=1)
 
 
 ########################################################################
@@ -459,72 +937,313 @@ def get_vacances_by_month(login, month=None, year=None):
 #
 ########################################################################
 
-@memoize
-def get_user_attendance_by_month(login, month=None, year=None):
+ATTENDANCE_CHUNK = 200
+
+
+class Attendance:
+    """
+    Asistencia ya convertida: check_in y check_out en segundos desde epoch
+    (check_out es None si la sesión sigue abierta) y local_in y local_out
+    en hora local. Las fechas se convierten una sola vez, al cargarlas.
+    """
+    __slots__ = ('check_in', 'check_out', 'worked_hours', 'local_in',
+                 'local_out')
+
+    def __init__(self, check_in, check_out, worked_hours):
+        self.check_in = parse_odoo_datetime(check_in)
+        self.local_in = datetime.fromtimestamp(self.check_in)
+        if check_out:
+            self.check_out = parse_odoo_datetime(check_out)
+            self.local_out = datetime.fromtimestamp(self.check_out)
+        else:
+            self.check_out = None
+            self.local_out = None
+        self.worked_hours = worked_hours
+
+
+attendance_store = MemoCache('attendance', STORE_SIZE, MEMO_TTL,
+                             current_month_key)
+
+
+def load_attendance(login, employee_ids, year, month_from=1, month_to=12):
+    """
+    Descarga las asistencias de varios empleados entre dos meses de un año
+    (una consulta por cada bloque de ATTENDANCE_CHUNK empleados) y las reparte
+    por (empleado, mes) en attendance_store.
+    Los meses que ya estén cargados, o que estén cerrados y guardados en la
+    caché local, no se vuelven a pedir.
+    """
+    months = range(month_from, month_to + 1)
+    missing = {}
+    for i in employee_ids:
+        for m in months:
+            key = (login['db'], i, year, m)
+            if not i or key in attendance_store:
+                continue
+            cached = disk_cache_attendance(login, i, year, m)
+            if cached is not None:
+                attendance_store[key] = cached
+            else:
+                missing.setdefault(i, []).append(m)
+    # Una consulta por cada tramo de meses seguidos que falten
+    runs = []
+    for m in sorted({m for months in missing.values() for m in months}):
+        if runs and runs[-1][-1] == m - 1:
+            runs[-1].append(m)
+        else:
+            runs.append([m])
+    for run in runs:
+        pending = [i for i, months in missing.items()
+                   if set(run) & set(months)]
+        next_year, next_month = divmod(run[-1], 12)
+        date_from = '{}-{:02d}-01 00:00:00'.format(year, run[0])
+        date_to = '{}-{:02d}-01 00:00:00'.format(year + next_year,
+                                                 next_month + 1)
+        for chunk in range(0, len(pending), ATTENDANCE_CHUNK):
+            chunk_ids = pending[chunk:chunk + ATTENDANCE_CHUNK]
+            attendance = login['conn'].execute_kw(
+                login['db'],
+                login['uid'],
+                login['password'],
+                'hr.attendance',
+                'search_read',
+                [[('employee_id', 'in', chunk_ids),
+                  ('check_in', '>=', date_from),
+                  ('check_in', '<', date_to)]],
+                {'fields': ['employee_id', 'check_in', 'check_out',
+                            'worked_hours', 'write_date']})
+            loaded = {(login['db'], i, year, m): [] for i in chunk_ids
+                      for m in run if m in missing[i]}
+            for e in attendance:
+                key = (login['db'], e['employee_id'][0], year,
+                       int(e['check_in'][5:7]))
+                if key in loaded:
+                    loaded[key].append(sync_row('hr.attendance', e))
+            attendance_store.update(
+                (key, [Attendance(*e[:3]) for e in rows])
+                for key, rows in loaded.items())
+            for (db, i, y, m), rows in loaded.items():
+                disk_cache_put(login, 'hr.attendance', i,
+                               '{}-{:02d}'.format(y, m), rows)
+            sync_record_loaded(login, 'hr.attendance', chunk_ids, attendance)
+            disk_cache_commit()
+
+
+def disk_cache_attendance(login, employee_id, year, month):
+    """
+    Asistencias (Attendance) de un mes guardadas en la caché local, o None
+    si no están (o son de un formato antiguo, sin el id)
+    """
+    cached = disk_cache_get(login, 'hr.attendance', employee_id,
+                            '{}-{:02d}'.format(year, month))
+    if cached is None or not all(len(e) == 4 for e in cached):
+        return None
+    return [Attendance(*e[:3]) for e in cached]
+
+
+ATTENDANCE_PAGE = 5000
+
+
+def attendance_by_months(login, months, year):
+    """
+    Asistencias del usuario en los meses indicados de un año, mes a mes y en
+    el mismo orden que get_user_attendance_by_month.
+    Los meses ya cargados (o guardados en la caché local) salen de ahí; el
+    resto se descarga con una consulta paginada (ATTENDANCE_PAGE) por cada
+    tramo de meses seguidos que falten, por orden de entrada y sin
+    guardarlo, así que en memoria sólo hay una página y un mes cada vez.
+    """
     user_id = get_user_id(login)
-    if year is None:
-        year = int(datetime.now().year)
-    if month is None:
-        month = int(datetime.now().month)
-    date_filter = "{}-{:02d}-%".format(year, month)
-    try:
-        attendance = login['conn'].execute_kw(
+    if not user_id:
+        return
+    loaded = {}
+    for m in months:
+        key = (login['db'], user_id, year, m)
+        if key in attendance_store:
+            loaded[m] = attendance_store[key]
+            continue
+        cached = disk_cache_attendance(login, user_id, year, m)
+        if cached is not None:
+            loaded[m] = cached
+    runs = []
+    for m in months:
+        if m in loaded:
+            continue
+        if runs and runs[-1][-1] == m - 1:
+            runs[-1].append(m)
+        else:
+            runs.append([m])
+    stream = itertools.chain.from_iterable(
+        stream_attendance(login, user_id, year, run[0], run[-1])
+        for run in runs)
+    pending = next(stream, None)
+    for m in months:
+        if m in loaded:
+            yield from loaded[m]
+            continue
+        rows = []
+        while pending is not None and pending[0] <= m:
+            if pending[0] == m:
+                rows.append(pending[1])
+            pending = next(stream, None)
+        # Odoo devuelve las asistencias de cada mes de la más reciente a la
+        # más antigua
+        rows.reverse()
+        yield from rows
+
+
+def stream_attendance(login, employee_id, year, month_from, month_to):
+    """
+    Genera (mes, Attendance) con las asistencias de un empleado entre dos
+    meses de un año, por orden de entrada, descargándolas por páginas
+    """
+    next_year, next_month = divmod(month_to, 12)
+    domain = [('employee_id', '=', employee_id),
+              ('check_in', '>=', '{}-{:02d}-01 00:00:00'.format(year,
+                                                               month_from)),
+              ('check_in', '<', '{}-{:02d}-01 00:00:00'.format(
+                  year + next_year, next_month + 1))]
+    offset = 0
+    while True:
+        page = login['conn'].execute_kw(
             login['db'],
             login['uid'],
             login['password'],
             'hr.attendance',
             'search_read',
-            [[('employee_id', '=', user_id),
-              ('check_in', '=like', date_filter)]],
-            {'fields': ['employee_id', 'check_in', 'check_out',
-                        'worked_hours']})
-    except TypeError:
-        return None
-    else:
-        for e in attendance:
-            yield e['check_in'], e['check_out'], e['worked_hours']
+            [domain],
+            {'fields': ['check_in', 'check_out', 'worked_hours'],
+             'order': 'check_in, id', 'offset': offset,
+             'limit': ATTENDANCE_PAGE})
+        for e in page:
+            yield int(e['check_in'][5:7]), Attendance(
+                e['check_in'], e['check_out'], e['worked_hours'])
+        if len(page) < ATTENDANCE_PAGE:
+            return
+        offset += ATTENDANCE_PAGE
+
+
+def prefetch_year_attendance(login, month=None, year=None):
+    """
+    Carga de una vez las asistencias del usuario desde enero hasta el mes
+    indicado (para los informes acumulados)
+    """
+    if year is None:
+        year = int(get_now(login).year)
+    if month is None:
+        month = int(get_now(login).month)
+    load_attendance(login, [get_user_id(login)], year, 1, month)
+
+
+def get_user_attendance_by_month(login, month=None, year=None):
+    """
+    Lista de asistencias (Attendance) del usuario en un mes, la misma que
+    hay en attendance_store (no se copia)
+    """
+    user_id = get_user_id(login)
+    if not user_id:
+        return []
+    if year is None:
+        year = int(get_now(login).year)
+    if month is None:
+        month = int(get_now(login).month)
+    load_attendance(login, [user_id], year, month, month)
+    return attendance_store[(login['db'], user_id, year, month)]
 
 
 def count_worked_hours(login, month=None, year=None):
     """
-    Horas trabajadas hasta el momento (se cuentan las de las sesión abierta)
+    Horas trabajadas hasta el momento (se cuentan las de las sesión abierta).
+    Si las asistencias de un mes pasado no están cargadas, la suma se pide
+    al servidor sin descargarlas (ver get_month_worked_hours).
     """
     if year is None:
-        year = int(datetime.now().year)
+        year = int(get_now(login).year)
     if month is None:
-        month = int(datetime.now().month)
+        month = int(get_now(login).month)
+    now = get_now(login)
     total = 0
-    if month == int(datetime.now().month) and year == int(datetime.now().year):
+    if month == now.month and year == now.year:
         total = open_session_worked_hours(login)
+    elif not attendance_cached(login, month, year):
+        return get_month_worked_hours(login, month, year)
     for e in get_user_attendance_by_month(login, month, year):
-        total += e[2]
+        total += e.worked_hours
     return total
 
 
+def attendance_cached(login, month, year):
+    """
+    Indica si las asistencias del usuario en un mes ya están cargadas o
+    guardadas en la caché local (y en ese caso las carga)
+    """
+    user_id = get_user_id(login)
+    key = (login['db'], user_id, year, month)
+    if key in attendance_store:
+        return True
+    cached = disk_cache_attendance(login, user_id, year, month)
+    if cached is None:
+        return False
+    attendance_store[key] = cached
+    return True
+
+
+@memoize(maxsize=256)
+def get_month_worked_hours(login, month=None, year=None):
+    """
+    Horas trabajadas por el usuario en un mes, sumadas en el servidor con un
+    read_group, sin descargar las asistencias
+    """
+    user_id = get_user_id(login)
+    if not user_id:
+        return 0
+    next_year, next_month = divmod(month, 12)
+    domain = [('employee_id', '=', user_id),
+              ('check_in', '>=', '{}-{:02d}-01 00:00:00'.format(year, month)),
+              ('check_in', '<', '{}-{:02d}-01 00:00:00'.format(
+                  year + next_year, next_month + 1))]
+    return worked_hours_groups(login, domain).get((user_id, None), (0, 0))[0]
+
+
 def count_worked_hours_today(login):
     """
     Horas trabajadas hoy (se cuentan las de las sesión abierta)
     """
-    today = datetime.now().strftime('%Y-%m-%d')
+    today = get_now(login).date()
     total = open_session_worked_hours(login)
     for e in get_user_attendance_by_month(login):
-        if e[1] and e[1][0:10] == today:
-            total += e[2]
+        if e.check_out and e.local_out.date() == today:
+            total += e.worked_hours
     return total
 
 
+def open_session(login):
+    """
+    Asistencia abierta hoy (sin salida) del usuario, o None.
+    Dentro de un informe se busca una sola vez y se guarda en login['now']
+    """
+    now = login.get('now')
+    if now is not None and now.session is not None:
+        return now.session or None
+    moment = get_now(login)
+    session = False
+    for e in get_user_attendance_by_month(login, moment.month, moment.year):
+        if not e.check_out and e.local_in.date() == moment.date():
+            session = e
+            break
+    if now is not None:
+        now.session = session
+    return session or None
+
+
 def open_session_worked_hours(login):
     """
     Horas trasncurridas desde la última sesión abierta y no cerrada
     """
-    today = int(datetime.now().day)
-    year = int(datetime.now().year)
-    month = int(datetime.now().month)
-    for e in get_user_attendance_by_month(login, month, year):
-        if not e[1] and str_to_localtime(e[0]).tm_mday == today:
-            delta = datetime.now() - datetime(*str_to_localtime(e[0])[:6])
-            return delta.total_seconds() / 3600
-    return 0
+    session = open_session(login)
+    if not session:
+        return 0
+    return (get_now(login) - session.local_in).total_seconds() / 3600
 
 
 ########################################################################
@@ -533,33 +1252,36 @@ def open_session_worked_hours(login):
 #
 ########################################################################
 
-def txt_date(idatetime, mode='DT'):
-    if mode == 'T':
-        date_format = "%H:%M:%S"
-    elif mode == 'D':
-        date_format = "%Y-%m-%d"
-    else:
-        date_format = "%Y-%m-%d %H:%M:%S"
 
-    try:
-        txt = time.strftime(date_format, idatetime)
-    except TypeError:
-        txt = '--------'
-    return txt
+def parse_odoo_datetime(datetime_str):
+    """
+    Segundos desde epoch de una fecha UTC de Odoo ("AAAA-MM-DD HH:MM:SS").
+    El formato es fijo, así que se trocea por posiciones sin strptime.
+    """
+    return calendar.timegm((int(datetime_str[0:4]), int(datetime_str[5:7]),
+                            int(datetime_str[8:10]), int(datetime_str[11:13]),
+                            int(datetime_str[14:16]), int(datetime_str[17:19])))
 
 
-def str_to_localtime(datetime_str):
-    try:
-        time_tuple = time.strptime(datetime_str, "%Y-%m-%d %H:%M:%S")
-        gm = calendar.timegm(time_tuple)
-    except TypeError:
-        return False
-    else:
-        return time.localtime(gm)
+def txt_local(value, mode='DT'):
+    """
+    Texto de un datetime en hora local (o None): fecha y hora ('DT'), sólo
+    la fecha ('D') o sólo la hora ('T')
+    """
+    if value is None:
+        return '--------'
+    if mode == 'T':
+        return value.strftime("%H:%M:%S")
+    elif mode == 'D':
+        return value.strftime("%Y-%m-%d")
+    return value.strftime("%Y-%m-%d %H:%M:%S")
 
 
-def tlocal(datetime_str, mode='DT'):
-    return txt_date(str_to_localtime(datetime_str), mode)
+def local_datetime(datetime_str):
+    """
+    Convierte una fecha UTC de Odoo en un datetime (sin zona) en hora local
+    """
+    return datetime.fromtimestamp(parse_odoo_datetime(datetime_str))
 
 
 def mes(month):
@@ -582,9 +1304,11 @@ def mes(month):
 
 def format_hours(time_decimal):
     sign = '-' if float(time_decimal) < 0 else ' '
-    h = int(abs(time_decimal))
-    m = int((abs(time_decimal) * 60) % 60)
-    s = int((abs(time_decimal) * 3600) % 60)
+    # El margen de un microsegundo evita que una suma en coma flotante
+    # (hecha en otro orden, p. ej. en el servidor) pierda un segundo
+    seconds = int(abs(time_decimal) * 3600 + 1e-6)
+    h, seconds = divmod(seconds, 3600)
+    m, s = divmod(seconds, 60)
     return "{}{:02}:{:02}:{:02}".format(sign, h, m, s)
 
 
@@ -592,9 +1316,9 @@ def get_args_date(month, year):
     if month:
         new_month, new_year = month, year
         if not year:
-            year = datetime.now().year
+            year = clock_now().year
         if month < 0:
-            current = int(datetime.now().month)
+            current = int(clock_now().month)
             result = divmod(current - 1 + month, 12)
             new_month = result[1] + 1
             new_year = year + result[0]
@@ -611,75 +1335,156 @@ def get_args_date(month, year):
         return month, year
 
 
-def get_user_id(login):
+def calendar_name_hours(calendar_name, units):
     """
-    Retorna el id en hr.employee del usuario logeado.
-    Es un poco ñapa mientras vemos cómo filtrar la query
+    Retorna las horas que menciona el nombre del horario si la unidad
+    (segunda palabra) es una de las indicadas, p.e. "60 mensuales"
     """
-    user_to_find = get_user_by_email(login) if 'user_email' in login else \
-        login['uid']
-    if not user_to_find:
-        sys.exit('El usuario no existe')
-    users = login['conn'].execute_kw(login['db'],
-                                     login['uid'],
-                                     login['password'],
-                                     'hr.employee',
-                                     'search_read',
-                                     [],
-                                     {'fields': ['user_id', 'id']})
-    for user in users:
-        if user['user_id'] and user['user_id'][0] == user_to_find:
-            return user['id']
+    cachos = calendar_name.split()
+    if len(cachos) > 1 and cachos[1].lower() in units:
+        try:
+            return float(cachos[0])
+        except ValueError:
+            pass
+    return None
 
 
-def get_user_by_email(login):
+class EmployeeProfile:
     """
-    Retorna el id del usaurio (en res.user)
-    a partir del email contenido en el campo 'user_email' de login (si lo hay).
+    Datos de un empleado que necesitan los informes: se construye una vez a
+    partir del registro de hr.employee, con la cuota de horas del nombre del
+    horario ya calculada.
     """
-    if 'user_email' in login:
+    __slots__ = ('id', 'user_id', 'calendar_id', 'calendar_name',
+                 'address_id', 'monthly_hours', 'total_hours')
+
+    def __init__(self, employee):
+        self.id = employee['id']
+        self.user_id = employee['user_id'] and employee['user_id'][0] or None
+        calendar = employee['calendar_id']
+        self.calendar_id = calendar and calendar[0] or None
+        self.calendar_name = calendar and calendar[-1] or ''
+        self.address_id = employee['address_id'] and \
+            employee['address_id'][0] or None
+        self.monthly_hours = calendar_name_hours(self.calendar_name,
+                                                 ('mensual', 'mensuales'))
+        self.total_hours = calendar_name_hours(self.calendar_name,
+                                               ('total', 'totales'))
+
+
+employees_index = {}
+
+
+def get_employees_index(login):
+    """
+    Índice de usuarios y empleados de la sesión.
+    Se carga una sola vez (dos search_read) y lo comparten todos los helpers:
+    {'users': [...], 'by_email': {email: user_id}, 'by_id': {user_id: user},
+     'employees': {user_id: EmployeeProfile}}
+    """
+    key = (login['db'], login['uid'])
+    if key not in employees_index:
         users = login['conn'].execute_kw(login['db'],
                                          login['uid'],
                                          login['password'],
                                          'res.users',
                                          'search_read',
-                                         [[('email', '=',
-                                            login['user_email'])]],
-                                         {'fields': ['email']})
+                                         [],
+                                         {'fields': ['email',
+                                                     'display_name']})
+        employees = login['conn'].execute_kw(login['db'],
+                                             login['uid'],
+                                             login['password'],
+                                             'hr.employee',
+                                             'search_read',
+                                             [],
+                                             {'fields': ['user_id',
+                                                         'calendar_id',
+                                                         'address_id']})
+        index = {'users': users, 'by_email': {}, 'by_id': {}, 'employees': {}}
         for user in users:
-            return user['id']
+            index['by_id'].setdefault(user['id'], user)
+            if user['email']:
+                index['by_email'].setdefault(user['email'], user['id'])
+        for employee in employees:
+            if employee['user_id']:
+                index['employees'].setdefault(employee['user_id'][0],
+                                              EmployeeProfile(employee))
+        employees_index[key] = index
+    return employees_index[key]
+
+
+def get_employee(login):
+    """
+    Retorna el perfil (EmployeeProfile) del usuario logeado o del indicado
+    en 'user_email', o None si no existe o no es empleado
+    """
+    user_to_find = get_user_by_email(login) if 'user_email' in login else \
+        login['uid']
+    if not user_to_find:
+        return None
+    return get_employees_index(login)['employees'].get(user_to_find)
+
+
+def get_employee_profile(login):
+    """
+    Como get_employee, pero sale si el usuario no es empleado: es lo que usan
+    los informes
+    """
+    profile = get_employee(login)
+    if profile is None:
+        if 'user_email' in login and not get_user_by_email(login):
+            sys.exit('El usuario no existe')
+        sys.exit('El usuario no es un empleado')
+    return profile
+
+
+def get_user_id(login):
+    """
+    Retorna el id en hr.employee del usuario logeado.
+    """
+    employee = get_employee(login)
+    if employee:
+        return employee.id
     return None
 
 
-def get_state_by_address(login, address_id):
+def get_user_by_email(login):
     """
-    Obtiene el código de provicia (state_id) a partir de un address_id
+    Retorna el id del usaurio (en res.user)
+    a partir del email contenido en el campo 'user_email' de login (si lo hay).
     """
-    states = login['conn'].execute_kw(login['db'],
-                                      login['uid'],
-                                      login['password'],
-                                      'res.partner',
-                                      'search_read',
-                                      [[('id', '=',
-                                         address_id)]],
-                                      {'fields': ["state_id"]})
-    return states[0]["state_id"][0]
+    if 'user_email' in login:
+        return get_employees_index(login)['by_email'].get(login['user_email'])
+    return None
 
 
-def get_address_id_employee(login):
+def get_state_by_address(login, address_id):
     """
-    Obtiene el address_id de un empleado
+    Obtiene el código de provicia (state_id) a partir de un address_id.
+    La primera vez carga las provincias de todas las direcciones de los
+    empleados con un solo read.
     """
-    user_id = get_user_id(login)
-    addresses = login['conn'].execute_kw(login['db'],
-                                         login['uid'],
-                                         login['password'],
-                                         'hr.employee',
-                                         'search_read',
-                                         [[('id', '=',
-                                            user_id)]],
-                                         {'fields': ["address_id"]})
-    return addresses[0]['address_id'][0]
+    index = get_employees_index(login)
+    states = index.setdefault('states', {})
+    if not address_id:
+        return False
+    if address_id not in states:
+        address_ids = {employee.address_id
+                       for employee in index['employees'].values()
+                       if employee.address_id}
+        address_ids.add(address_id)
+        partners = login['conn'].execute_kw(login['db'],
+                                            login['uid'],
+                                            login['password'],
+                                            'res.partner',
+                                            'read',
+                                            [sorted(address_ids)],
+                                            {'fields': ["state_id"]})
+        for partner in partners:
+            states[partner['id']] = partner['state_id'] and \
+                partner['state_id'][0]
+    return states[address_id]
 
 
 def get_mail_users(login, user_id=None):
@@ -687,23 +1492,11 @@ def get_mail_users(login, user_id=None):
     Retorna los emails de todos los usuarios
     o el de la ID que se le pase
     """
+    index = get_employees_index(login)
     if user_id:
-        users = login['conn'].execute_kw(login['db'],
-                                         login['uid'],
-                                         login['password'],
-                                         'res.users',
-                                         'search_read',
-                                         [[('id', '=',
-                                            user_id)]],
-                                         {'fields': ['email']})
+        users = [index['by_id'][user_id]] if user_id in index['by_id'] else []
     else:
-        users = login['conn'].execute_kw(login['db'],
-                                         login['uid'],
-                                         login['password'],
-                                         'res.users',
-                                         'search_read',
-                                         [],
-                                         {'fields': ['email']})
+        users = index['users']
     for user in users:
         yield user['email']
 
@@ -713,34 +1506,34 @@ def get_name_users(login, user_id=None):
     Retorna los nombres de todos los usuarios
     o el de la ID que se le pase
     """
+    index = get_employees_index(login)
     if user_id:
-        users = login['conn'].execute_kw(login['db'],
-                                         login['uid'],
-                                         login['password'],
-                                         'res.users',
-                                         'search_read',
-                                         [[('id', '=',
-                                            user_id)]],
-                                         {'fields': ['display_name']})
+        users = [index['by_id'][user_id]] if user_id in index['by_id'] else []
     else:
-        users = login['conn'].execute_kw(login['db'],
-                                         login['uid'],
-                                         login['password'],
-                                         'res.users',
-                                         'search_read',
-                                         [],
-                                         {'fields': ['display_name']})
+        users = index['users']
     for user in users:
         yield user['display_name']
 
 
 def send_mail(mail_to, subject, message, file_name, file_data):
-    mail_server = os.environ.get('ODOOCLI_MAIL_SERVER')
-    mail_port = os.environ.get('ODOOCLI_MAIL_PORT')
-    mail_tls = os.environ.get('ODOOCLI_MAIL_TLS')
+    mail_from, mail_to_list, msg = build_mail(mail_to, subject, message,
+                                              file_name, file_data)
+    if mail_outbox is not None:
+        mail_outbox.spool(mail_from, mail_to_list, msg.as_bytes(), mail_to)
+    elif mail_pool is not None:
+        mail_pool.send(mail_from, mail_to_list, msg.as_string(), mail_to)
+    else:
+        session = SmtpSession()
+        session.send(mail_from, mail_to_list, msg.as_string())
+        session.quit()
+
+
+def build_mail(mail_to, subject, message, file_name, file_data):
+    """
+    Compone el correo. Retorna (remitente, destinatarios, mensaje MIME)
+    """
     mail_user = os.environ.get('ODOOCLI_MAIL_USER')
     mail_from = os.environ.get('ODOOCLI_MAIL_FROM') or mail_user
-    mail_password = os.environ.get('ODOOCLI_MAIL_PASSWORD')
     mail_reply_to = os.environ.get('ODOOCLI_MAIL_REPLY_TO')
     mail_cc = os.environ.get('ODOOCLI_MAIL_CC')
     mail_bcc = os.environ.get('ODOOCLI_MAIL_BCC')
@@ -769,228 +1562,1699 @@ def send_mail(mail_to, subject, message, file_name, file_data):
     part.add_header('Content-Disposition',
                     'attachment; filename="{}"'.format(file_name))
     msg.attach(part)
+    return mail_from, mail_to_list, msg
 
-    smtp = smtplib.SMTP(mail_server, mail_port)
-    if mail_tls:
-        smtp.starttls()
-    smtp.login(mail_user, mail_password)
-    smtp.sendmail(mail_from, mail_to_list, msg.as_string())
-    smtp.quit()
 
+class SmtpSession:
+    """
+    Sesión SMTP autenticada que se reutiliza para varios correos.
+    Se abre al enviar el primero, se renueva cada max_messages correos y
+    vuelve a conectar si el servidor ha cerrado la conexión.
+    """
+
+    def __init__(self, max_messages=None):
+        self.max_messages = max_messages
+        self.smtp = None
+        self.sent = 0
+
+    def connect(self):
+        """
+        Abre y autentica una conexión nueva; sólo se guarda en la sesión si
+        el login ha ido bien
+        """
+        smtp = smtplib.SMTP(os.environ.get('ODOOCLI_MAIL_SERVER'),
+                            os.environ.get('ODOOCLI_MAIL_PORT'))
+        try:
+            if os.environ.get('ODOOCLI_MAIL_TLS'):
+                smtp.starttls()
+            smtp.login(os.environ.get('ODOOCLI_MAIL_USER'),
+                       os.environ.get('ODOOCLI_MAIL_PASSWORD'))
+        except BaseException:
+            smtp.close()
+            raise
+        self.smtp = smtp
+        self.sent = 0
+
+    def send(self, mail_from, mail_to_list, msg_string):
+        for attempt in (0, 1):
+            try:
+                if self.smtp is None:
+                    self.connect()
+                self.smtp.sendmail(mail_from, mail_to_list, msg_string)
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                self.close()
+                if attempt:
+                    raise
+            except smtplib.SMTPResponseException as e:
+                # 421: el servidor cierra la sesión (p. ej. límite de envíos)
+                if e.smtp_code != 421:
+                    raise
+                self.close()
+                if attempt:
+                    raise
+            else:
+                break
+        self.sent += 1
+        if self.max_messages and self.sent >= self.max_messages:
+            self.quit()
+
+    def quit(self):
+        if self.smtp is not None:
+            try:
+                self.smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+        self.smtp = None
+
+    def close(self):
+        if self.smtp is not None:
+            self.smtp.close()
+        self.smtp = None
+
+
+mail_pool = None
+
+
+class MailPool:
+    """
+    Envío de correos reutilizando sesiones SMTP: size sesiones que envían en
+    paralelo, cada una de como mucho max_messages correos por conexión.
+    Con size=1 cada envío espera a que termine (los errores se lanzan como
+    con send_mail); con más sesiones se envía en segundo plano y los errores
+    se recogen en failures.
+    """
+
+    def __init__(self, size=1, max_messages=None):
+        self.size = max(1, size)
+        self.max_messages = max_messages
+        self.executor = ThreadPoolExecutor(max_workers=self.size)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.sessions = []
+        self.pending = []
+        self.failures = []
+
+    def session(self):
+        if not hasattr(self.local, 'session'):
+            self.local.session = SmtpSession(self.max_messages)
+            with self.lock:
+                self.sessions.append(self.local.session)
+        return self.local.session
+
+    def deliver(self, mail_from, mail_to_list, msg_string):
+        self.session().send(mail_from, mail_to_list, msg_string)
+
+    def submit(self, mail_from, mail_to_list, msg_string):
+        """
+        Encola un envío y retorna su Future
+        """
+        return self.executor.submit(self.deliver, mail_from, mail_to_list,
+                                    msg_string)
+
+    def send(self, mail_from, mail_to_list, msg_string, name=None):
+        future = self.submit(mail_from, mail_to_list, msg_string)
+        if self.size == 1:
+            future.result()
+        else:
+            with self.lock:
+                self.pending.append((name or mail_to_list[0], future))
+
+    def close(self):
+        """
+        Espera a los envíos pendientes y cierra las sesiones.
+        Retorna la lista de (destinatario, error) de los que han fallado.
+        """
+        for name, future in self.pending:
+            try:
+                future.result()
+            except (smtplib.SMTPException, OSError) as e:
+                self.failures.append((name, e))
+        self.pending = []
+        self.executor.shutdown(wait=True)
+        for session in self.sessions:
+            session.quit()
+        return self.failures
+
+
+def open_mail_pool():
+    """
+    Crea el pool de envío según ODOOCLI_MAIL_POOL (sesiones en paralelo,
+    1 por defecto) y ODOOCLI_MAIL_PER_CONNECTION (correos por conexión,
+    100 por defecto)
+    """
+    return MailPool(int(os.environ.get('ODOOCLI_MAIL_POOL') or 1),
+                    int(os.environ.get('ODOOCLI_MAIL_PER_CONNECTION') or 100))
+
+
+mail_outbox = None
+
+
+class Outbox:
+    """
+    Bandeja de salida en disco, al estilo maildir: cada correo se guarda ya
+    compuesto (.eml) junto con su sobre y su estado (.json).
+    tmp/ mientras se escribe, new/ pendiente de envío, work/ enviándose,
+    cur/ enviado y failed/ descartado tras agotar los reintentos.
+    """
+    folders = ('tmp', 'new', 'work', 'cur', 'failed')
+    counter = itertools.count(1)
+
+    def __init__(self, path):
+        self.path = Path(path)
+        for folder in self.folders:
+            (self.path / folder).mkdir(parents=True, exist_ok=True)
+
+    def spool(self, mail_from, mail_to_list, msg_bytes, name=''):
+        """
+        Guarda un correo en new/ (se escribe en tmp/ y se mueve, para que
+        quien vacía la bandeja nunca vea un correo a medias)
+        """
+        key = '{:.6f}.{}.{}.{}'.format(time.time(), os.getpid(),
+                                       next(self.counter),
+                                       name.split('@')[0] or 'mail')
+        status = {'from': mail_from, 'to': mail_to_list, 'name': name,
+                  'attempts': 0, 'next_try': 0, 'status': 'pending',
+                  'last_error': None}
+        (self.path / 'tmp' / (key + '.eml')).write_bytes(msg_bytes)
+        (self.path / 'tmp' / (key + '.json')).write_text(json.dumps(status))
+        for ext in ('.eml', '.json'):
+            os.replace(self.path / 'tmp' / (key + ext),
+                       self.path / 'new' / (key + ext))
+        return key
+
+    def pending(self):
+        """
+        [(clave, estado)] de los correos de new/ por orden de llegada
+        """
+        result = []
+        for status_file in sorted((self.path / 'new').glob('*.json')):
+            try:
+                result.append((status_file.stem,
+                               json.loads(status_file.read_text())))
+            except FileNotFoundError:
+                # Lo acaba de reclamar otro proceso
+                pass
+        return result
+
+    def claim(self, key):
+        """
+        Reclama un correo moviéndolo de new/ a work/. El .json se mueve
+        primero: si otro proceso se ha adelantado ya no está y se retorna
+        None; si no, se retorna su estado.
+        """
+        try:
+            os.replace(self.path / 'new' / (key + '.json'),
+                       self.path / 'work' / (key + '.json'))
+        except FileNotFoundError:
+            return None
+        os.replace(self.path / 'new' / (key + '.eml'),
+                   self.path / 'work' / (key + '.eml'))
+        status = json.loads((self.path / 'work' / (key + '.json')).read_text())
+        status['status'] = 'sending'
+        status['pid'] = os.getpid()
+        (self.path / 'work' / (key + '.json')).write_text(json.dumps(status))
+        return status
+
+    def move(self, key, status, folder):
+        """
+        Guarda el estado y saca el correo de work/ hacia folder. El .json se
+        mueve el último, para que en new/ nunca haya un estado sin su correo.
+        """
+        (self.path / 'work' / (key + '.json')).write_text(json.dumps(status))
+        for ext in ('.eml', '.json'):
+            os.replace(self.path / 'work' / (key + ext),
+                       self.path / folder / (key + ext))
+
+    def read(self, key):
+        return (self.path / 'work' / (key + '.eml')).read_bytes()
+
+    def deliver(self, pool, retries=5, backoff=60, wait=True):
+        """
+        Envía los correos pendientes. Cada correo se reclama antes de
+        enviarlo, así que varios procesos pueden vaciar la misma bandeja sin
+        enviar nada dos veces. Los que fallan, por cualquier error, vuelven a
+        new/ y se reintentan más tarde (backoff, 2 * backoff, 4 * backoff...
+        segundos) y, tras retries intentos, pasan a failed/. Con wait=True
+        espera a los reintentos hasta vaciar new/; si no, hace una sola
+        pasada.
+        Retorna (enviados, descartados, pendientes).
+        """
+        sent = dead = 0
+        while True:
+            now = time.time()
+            futures = []
+            for key, status in self.pending():
+                if status['next_try'] > now:
+                    continue
+                status = self.claim(key)
+                if status is None:
+                    continue
+                try:
+                    future = pool.submit(status['from'], status['to'],
+                                         self.read(key))
+                except Exception as e:
+                    future = Future()
+                    future.set_exception(e)
+                futures.append((key, status, future))
+            for key, status, future in futures:
+                status['attempts'] += 1
+                try:
+                    future.result()
+                except Exception as e:
+                    status['last_error'] = '{}: {}'.format(
+                        type(e).__name__, e)
+                    if status['attempts'] >= retries:
+                        status['status'] = 'failed'
+                        self.move(key, status, 'failed')
+                        dead += 1
+                        print('Descartado', status['name'], ':', e)
+                    else:
+                        status['status'] = 'pending'
+                        status['next_try'] = time.time() + backoff * 2 ** (
+                            status['attempts'] - 1)
+                        self.move(key, status, 'new')
+                        print('Error enviando a', status['name'],
+                              '(intento {}):'.format(status['attempts']), e)
+                else:
+                    status['status'] = 'sent'
+                    status['sent_at'] = formatdate(localtime=True)
+                    self.move(key, status, 'cur')
+                    sent += 1
+                    print('Enviado', status['name'])
+            pending = self.pending()
+            if not pending or not wait:
+                return sent, dead, len(pending)
+            time.sleep(max(0, min(item['next_try'] for key, item in pending)
+                           - time.time()))
+
+
+def deliver_outbox(path, wait=True):
+    """
+    Vacía la bandeja de salida usando el pool de sesiones SMTP.
+    Los reintentos y la espera entre ellos (en segundos) se toman de
+    ODOOCLI_MAIL_RETRIES (5 por defecto) y ODOOCLI_MAIL_BACKOFF (60).
+    """
+    pool = open_mail_pool()
+    try:
+        return Outbox(path).deliver(
+            pool,
+            int(os.environ.get('ODOOCLI_MAIL_RETRIES') or 5),
+            float(os.environ.get('ODOOCLI_MAIL_BACKOFF') or 60),
+            wait)
+    finally:
+        pool.close()
+
+
+def get_employee_id(index, mail):
+    """
+    Retorna el id en hr.employee del usuario con ese email, o None
+    """
+    employee = index['employees'].get(index['by_email'].get(mail))
+    return employee and employee.id
 
-def bulk(login, mails, function, *argus):
-    if not mails:
-        mails = get_mail_users(login)
 
+def active_employees(login, mails, month=None, year=None):
+    """
+    Retorna el conjunto de ids de hr.employee de los usuarios de mails que
+    tienen alguna asistencia hasta el final del mes indicado. Sale del
+    read_group de horas de toda la vida, sin consultas por usuario.
+    """
+    if year is None:
+        year = int(get_now(login).year)
+    if month is None:
+        month = int(get_now(login).month)
+    employee_ids = get_employee_ids(login, mails)
+    load_life_hours(login, employee_ids, month, year)
+    return {i for i in employee_ids
+            if life_hours[(login['db'], i, year, month)][1]}
+
+
+def get_employee_ids(login, mails):
+    """
+    Retorna los ids en hr.employee de los usuarios de la lista de emails
+    """
+    index = get_employees_index(login)
+    employee_ids = []
     for user in mails:
-        new_login_data = dict(login)
-        new_login_data['user_email'] = user
-        if count_worked_hours(new_login_data, argus[-2], argus[-1]) or count_worked_hours_on_life(new_login_data, argus[-2], argus[-1]):
-            print('Procesando', user)
+        employee_id = get_employee_id(index, user)
+        if employee_id:
+            employee_ids.append(employee_id)
+    return employee_ids
+
+
+def bulk_prefetch(login, mails, month=None, year=None, accumulated=False,
+                  today=False):
+    """
+    Carga de una vez, para todos los usuarios, los datos que luego se
+    consultan usuario a usuario: horas trabajadas desde siempre, horarios,
+    festivos, ausencias y asistencias del periodo (desde enero si el informe
+    es acumulado, y también las del mes corriente si today).
+    """
+    if year is None:
+        year = int(get_now(login).year)
+    if month is None:
+        month = int(get_now(login).month)
+    index = get_employees_index(login)
+    profiles = [profile for profile in (
+        index['employees'].get(index['by_email'].get(mail)) for mail in mails)
+        if profile]
+    employee_ids = [profile.id for profile in profiles]
+    load_life_hours(login, employee_ids, month, year)
+    load_calendar_weeks(login, [profile.calendar_id for profile in profiles])
+    load_leaves(login, employee_ids, year)
+    if accumulated:
+        load_attendance(login, employee_ids, year, 1, month)
+        if month == 1:
+            load_leaves(login, employee_ids, year - 1)
+            load_attendance(login, employee_ids, year - 1)
+    else:
+        load_attendance(login, employee_ids, year, month, month)
+    years = {year}
+    if accumulated and month == 1:
+        years.add(year - 1)
+    if today:
+        now = get_now(login)
+        years.add(now.year)
+        load_life_hours(login, employee_ids, now.month, now.year)
+        load_leaves(login, employee_ids, now.year)
+        load_attendance(login, employee_ids, now.year, now.month, now.month)
+    # Festivos, provincias y calendarios anuales se comparten entre los
+    # hilos de bulk: se cargan aquí, antes de repartir los usuarios, para
+    # que no los pidan varios hilos a la vez
+    for y in sorted(years):
+        for profile in profiles:
+            get_calendar_year(login, profile.calendar_id,
+                              get_state_by_address(login, profile.address_id),
+                              y)
+
+
+def bulk(login, mails, function, *argus, jobs=1):
+    """
+    Ejecuta function para cada usuario de mails.
+    Con jobs > 1 los usuarios se procesan en paralelo, cada hilo con su
+    propia conexión; la salida de cada usuario se muestra agrupada y en el
+    mismo orden que en el modo secuencial.
+    Mientras dura no caduca nada en las cachés en memoria: lo cargado antes
+    para todos los usuarios vale hasta el último.
+    """
+    with memo_snapshot():
+        if not mails:
+            mails = get_mail_users(login)
+        # Los usuarios sin email no se pueden buscar ni avisar
+        mails = [user for user in mails if user]
+
+        active = active_employees(login, mails, argus[-2], argus[-1])
+        index = get_employees_index(login)
+        bulk_prefetch(login, [user for user in mails
+                              if get_employee_id(index, user) in active],
+                      argus[-2], argus[-1],
+                      function in (year_summary, accumulated_list_to_csv,
+                                   mail_report_accumulated),
+                      # year_summary empieza con el resumen de hoy
+                      function is year_summary)
+
+        if jobs <= 1:
+            for user in mails:
+                bulk_user(login, user, function, *argus, active=active)
+            return
+
+        output = ThreadOutput(sys.stdout)
+        workers = threading.local()
+
+        def worker(user):
+            if not hasattr(workers, 'conn'):
+                workers.conn = object_proxy()
+            worker_login = dict(login)
+            worker_login['conn'] = workers.conn
+            output.local.buffer = io.StringIO()
+            try:
+                bulk_user(worker_login, user, function, *argus, active=active)
+                return output.local.buffer.getvalue()
+            finally:
+                output.local.buffer = None
+
+        sys.stdout = output
+        try:
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                for text in executor.map(worker, mails):
+                    output.stream.write(text)
+        finally:
+            sys.stdout = output.stream
+
+
+def bulk_user(login, user, function, *argus, active=None):
+    """
+    Ejecuta function para un usuario si su empleado está en active (los que
+    tienen alguna asistencia hasta el final del periodo). Al terminar se
+    libera la memoria usada para ese usuario.
+    """
+    new_login_data = dict(login)
+    new_login_data['user_email'] = user
+    if active is None:
+        active = active_employees(login, [user], argus[-2], argus[-1])
+    if get_user_id(new_login_data) in active:
+        print('Procesando', user)
+        try:
             function(new_login_data, *argus)
+        finally:
+            memo_drop_user(new_login_data)
+    else:
+        print('Se omite', user)
+
+
+class ThreadOutput:
+    """
+    Sustituye a sys.stdout durante el procesado en paralelo: lo que escribe
+    un hilo con buffer propio se acumula en él en lugar de mezclarse con la
+    salida de los demás.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def write(self, text):
+        buffer = getattr(self.local, 'buffer', None)
+        if buffer is None:
+            return self.stream.write(text)
+        return buffer.write(text)
+
+    def flush(self):
+        if getattr(self.local, 'buffer', None) is None:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class ReadTimeoutMixin:
+    """
+    Usa timeout sólo para establecer la conexión (y el TLS) y read_timeout
+    para las lecturas posteriores
+    """
+    read_timeout = None
+
+    def connect(self):
+        super().connect()
+        self.sock.settimeout(self.read_timeout)
+
+
+class TimeoutHTTPConnection(ReadTimeoutMixin, http.client.HTTPConnection):
+    pass
+
+
+class TimeoutHTTPSConnection(ReadTimeoutMixin, http.client.HTTPSConnection):
+    pass
+
+
+class KeepAliveTransport(xmlrpc.client.SafeTransport):
+    """
+    Transporte XML-RPC (http o https) que mantiene abierta una conexión
+    persistente, pide las respuestas comprimidas con gzip, aplica tiempos
+    máximos de conexión y de lectura y vuelve a conectar si el servidor ha
+    cerrado la conexión.
+    """
+    accept_gzip_encoding = True
+    # Bytes del cuerpo de la última petición y de su respuesta (tal como
+    # viajan, comprimida si lo está), para --profile
+    last_sent = 0
+    last_received = 0
+
+    def __init__(self, https=True, connect_timeout=None, read_timeout=None):
+        super().__init__()
+        self.https = https
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+    def send_content(self, connection, request_body):
+        self.last_sent = len(request_body)
+        super().send_content(connection, request_body)
+
+    def parse_response(self, response):
+        self.last_received = int(response.getheader('Content-Length') or 0)
+        return super().parse_response(response)
+
+    def make_connection(self, host):
+        if self._connection and host == self._connection[0]:
+            return self._connection[1]
+        chost, self._extra_headers, x509 = self.get_host_info(host)
+        if self.https:
+            conn = TimeoutHTTPSConnection(chost, None,
+                                          timeout=self.connect_timeout,
+                                          context=self.context, **x509)
+        else:
+            conn = TimeoutHTTPConnection(chost, timeout=self.connect_timeout)
+        conn.read_timeout = self.read_timeout
+        self._connection = host, conn
+        return conn
+
+    def request(self, host, handler, request_body, verbose=False):
+        # Si la conexión guardada está caducada se reintenta una vez
+        for attempt in (0, 1):
+            try:
+                return self.single_request(host, handler, request_body,
+                                           verbose)
+            except (ConnectionError, http.client.BadStatusLine,
+                    http.client.ImproperConnectionState):
+                self.close()
+                if attempt:
+                    raise
+
+    def json_request(self, host, handler, request_body):
+        """
+        POST de un cuerpo JSON por la misma conexión persistente.
+        Retorna el cuerpo de la respuesta ya descomprimido.
+        """
+        for attempt in (0, 1):
+            try:
+                conn = self.make_connection(host)
+                conn.putrequest('POST', handler, skip_accept_encoding=True)
+                for key, value in self._extra_headers + [
+                        ('Accept-Encoding', 'gzip'),
+                        ('Content-Type', 'application/json'),
+                        ('User-Agent', self.user_agent),
+                        ('Content-Length', str(len(request_body)))]:
+                    conn.putheader(key, value)
+                conn.endheaders(request_body)
+                self.last_sent = len(request_body)
+                response = conn.getresponse()
+                data = response.read()
+                self.last_received = len(data)
+            except (ConnectionError, http.client.BadStatusLine,
+                    http.client.ImproperConnectionState):
+                self.close()
+                if attempt:
+                    raise
+            except Exception:
+                self.close()
+                raise
+            else:
+                if response.status != 200:
+                    self.close()
+                    raise xmlrpc.client.ProtocolError(
+                        host + handler, response.status, response.reason,
+                        dict(response.getheaders()))
+                if response.getheader('Content-Encoding', '') == 'gzip':
+                    data = gzip.decompress(data)
+                return data
+
+
+class JsonRpcProxy:
+    """
+    Equivalente a xmlrpc.client.ServerProxy para el endpoint /jsonrpc de
+    Odoo: proxy.execute_kw(...) o proxy.authenticate(...) llaman al método
+    del servicio indicado. Los errores de Odoo se lanzan como
+    xmlrpc.client.Fault, igual que con XML-RPC.
+    """
+    ids = itertools.count(1)
+
+    def __init__(self, url, service, transport):
+        parts = urllib.parse.urlsplit(url)
+        self.host = parts.netloc
+        self.handler = (parts.path.rstrip('/') or '') + '/jsonrpc'
+        self.service = service
+        self.transport = transport
+
+    def __getattr__(self, method):
+        if method.startswith('_'):
+            raise AttributeError(method)
+
+        def call(*args):
+            return self.call(method, *args)
+        return call
+
+    def call(self, method, *args):
+        check_marshallable(args)
+        body = json.dumps({'jsonrpc': '2.0', 'method': 'call',
+                           'id': next(self.ids),
+                           'params': {'service': self.service,
+                                      'method': method,
+                                      'args': args}}).encode()
+        response = json.loads(self.transport.json_request(
+            self.host, self.handler, body))
+        if response.get('error'):
+            error = response['error']
+            data = error.get('data') or {}
+            raise xmlrpc.client.Fault(
+                error.get('code', 1),
+                data.get('message') or error.get('message', ''))
+        return response.get('result')
+
+
+def check_marshallable(value):
+    """
+    XML-RPC no admite None (el programa cuenta con el TypeError que lanza
+    xmlrpc.client); se reproduce el mismo error con JSON-RPC
+    """
+    if value is None:
+        raise TypeError('cannot marshal None unless allow_none is enabled')
+    if isinstance(value, (list, tuple)):
+        for item in value:
+            check_marshallable(item)
+    elif isinstance(value, dict):
+        for item in value.values():
+            check_marshallable(item)
+
+
+# 'xmlrpc' o 'jsonrpc'
+rpc_backend = os.environ.get('ODOOCLI_RPC') or 'xmlrpc'
+
+rpc_local = threading.local()
+
+
+def get_transport():
+    """
+    Transporte del hilo actual: una sola conexión persistente por hilo,
+    compartida por los servicios common y object.
+    Los tiempos máximos (en segundos) se toman de las variables de entorno
+    ODOOCLI_CONNECT_TIMEOUT y ODOOCLI_READ_TIMEOUT.
+    """
+    if not hasattr(rpc_local, 'transport'):
+        rpc_local.transport = KeepAliveTransport(
+            server.lower().startswith('https'),
+            float(os.environ.get('ODOOCLI_CONNECT_TIMEOUT') or 30),
+            float(os.environ.get('ODOOCLI_READ_TIMEOUT') or 300))
+    return rpc_local.transport
+
+
+def common_proxy():
+    """
+    Nueva conexión con el servicio common (/xmlrpc/2/common o /jsonrpc,
+    según rpc_backend)
+    """
+    return service_proxy('common')
+
+
+def object_proxy():
+    """
+    Nueva conexión con el servicio object (/xmlrpc/2/object o /jsonrpc,
+    según rpc_backend)
+    """
+    return service_proxy('object')
+
+
+def service_proxy(service):
+    transport = get_transport()
+    if rpc_cassette and rpc_cassette.replay:
+        proxy = CassetteProxy(rpc_cassette, service)
+    else:
+        if rpc_backend == 'jsonrpc':
+            proxy = JsonRpcProxy(server, service, transport)
         else:
-            print('Se omite', user)
+            proxy = xmlrpc.client.ServerProxy(
+                '{}/xmlrpc/2/{}'.format(server.rstrip('/'), service),
+                transport=transport)
+        if rpc_cassette:
+            proxy = CassetteProxy(rpc_cassette, service, proxy)
+    if rpc_profiler:
+        return ProfiledProxy(proxy, service, transport, rpc_profiler)
+    return proxy
 
 
 ##################################################
 #
-# Todas estas funciones son para sacar el horario semanal
+# Perfil de llamadas RPC (--profile)
 #
 ##################################################
 
-def get_horario_id_employee(login):
+rpc_profiler = None
+
+
+class RpcProfiler:
     """
-    Retrona la ID del horario del trabajador
+    Registro de todas las llamadas RPC: servicio, modelo, método, forma del
+    dominio, duración, bytes enviados y recibidos y función que la hizo
     """
-    user_id = get_user_id(login)
-    calendar = login['conn'].execute_kw(login['db'],
-                                        login['uid'],
-                                        login['password'],
-                                        'hr.employee',
-                                        'search_read',
-                                        [[('id', '=',
-                                           user_id)]],
-                                        {'fields': ['calendar_id']})
-
-    if calendar[0]['calendar_id']:
-        return calendar[0]['calendar_id'][0]
-    else:
-        return None
 
-
-def get_mountly_hours_from_calendar_name(login):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = []
+
+    def record(self, call):
+        with self.lock:
+            self.calls.append(call)
+
+    def summary(self, key):
+        """
+        Agrupa las llamadas por key(call). Retorna una lista, de más a menos
+        tiempo total, de (grupo, llamadas, segundos, p95, enviado, recibido)
+        """
+        groups = {}
+        for call in self.calls:
+            groups.setdefault(key(call), []).append(call)
+        rows = []
+        for name, calls in groups.items():
+            times = sorted(call['seconds'] for call in calls)
+            rows.append((name, len(calls), sum(times),
+                         times[-(-len(times) * 95 // 100) - 1],
+                         sum(call['sent'] for call in calls),
+                         sum(call['received'] for call in calls)))
+        return sorted(rows, key=lambda row: -row[2])
+
+    def report(self, out):
+        print('\nPerfil RPC: {} llamadas, {:.3f} s, {} bytes enviados, {} '
+              'recibidos'.format(
+                  len(self.calls), sum(c['seconds'] for c in self.calls),
+                  sum(c['sent'] for c in self.calls),
+                  sum(c['received'] for c in self.calls)), file=out)
+        for title, key in (
+                ('Modelo y método',
+                 lambda call: '{} {}'.format(call['model'] or call['service'],
+                                             call['method'])),
+                ('Función', lambda call: call['caller'])):
+            print('\nLlamadas | Total      | p95        | Enviado    | '
+                  'Recibido   | {}'.format(title), file=out)
+            for name, calls, total, p95, sent, received in \
+                    self.summary(key):
+                print('{:8} | {:8.1f} ms | {:8.1f} ms | {:10} | {:10} | {}'
+                      .format(calls, total * 1000, p95 * 1000, sent,
+                              received, name), file=out)
+        memo_report(out)
+
+    def dump(self, path):
+        """
+        Guarda las llamadas en path, una por línea en JSON
+        """
+        with open(path, 'w') as out:
+            for call in self.calls:
+                print(json.dumps(call), file=out)
+
+
+class ProfiledProxy:
     """
-    Retorna las horas mensuales, si el nombre delo horario las menciona
+    Envuelve un proxy (XML-RPC o JSON-RPC) y anota cada llamada en el
+    RpcProfiler
     """
-    user_id = get_user_id(login)
-    hours = None
-    calendar = login['conn'].execute_kw(login['db'],
-                                        login['uid'],
-                                        login['password'],
-                                        'hr.employee',
-                                        'search_read',
-                                        [[('id', '=',
-                                           user_id)]],
-                                        {'fields': ['calendar_id']})
-
-    if calendar[0]['calendar_id']:
-        calendar_name = calendar[0]['calendar_id'][-1]
-        cachos = calendar_name.split()
-        if len(cachos) > 1 and (cachos[1].lower() == "mensual" or cachos[1].lower() == "mensuales"):
+
+    def __init__(self, proxy, service, transport, profiler):
+        self.proxy = proxy
+        self.service = service
+        self.transport = transport
+        self.profiler = profiler
+
+    def __getattr__(self, method):
+        if method.startswith('_'):
+            raise AttributeError(method)
+        target = getattr(self.proxy, method)
+
+        def call(*args):
+            caller = sys._getframe(1).f_code.co_name
+            self.transport.last_sent = self.transport.last_received = 0
+            start = time.time()
+            error = None
             try:
-                hours = float(cachos[0])
-            except ValueError:
-                pass
-    return hours
+                return target(*args)
+            except Exception as e:
+                error = type(e).__name__
+                raise
+            finally:
+                seconds = time.time() - start
+                model, rpc_method, shape = '', method, ''
+                if method == 'execute_kw' and len(args) > 4:
+                    model, rpc_method = args[3], args[4]
+                    shape = call_shape(rpc_method, args[5:])
+                self.profiler.record({
+                    'start': start, 'seconds': seconds,
+                    'service': self.service, 'model': model,
+                    'method': rpc_method, 'domain': shape,
+                    'sent': self.transport.last_sent,
+                    'received': self.transport.last_received,
+                    'caller': caller, 'thread': threading.get_ident(),
+                    'error': error})
+        return call
+
+
+def call_shape(method, args):
+    """
+    Forma de los argumentos de execute_kw sin sus valores, p.e.
+    "employee_id in [200], check_in >= str" o "ids [12]"
+    """
+    positional = args[0] if args else []
+    if method == 'read':
+        return 'ids [{}]'.format(len(positional[0]) if positional else 0)
+    if not positional or not isinstance(positional[0], (list, tuple)):
+        return ''
+    parts = []
+    for leaf in positional[0]:
+        if isinstance(leaf, (list, tuple)) and len(leaf) == 3:
+            value = leaf[2]
+            if isinstance(value, (list, tuple)):
+                value = '[{}]'.format(len(value))
+            else:
+                value = type(value).__name__
+            parts.append('{} {} {}'.format(leaf[0], leaf[1], value))
+        else:
+            parts.append(str(leaf))
+    return ', '.join(parts)
+
+
+##################################################
+#
+# Grabación y reproducción de llamadas RPC (--record / --replay)
+#
+##################################################
+
+rpc_cassette = None
 
 
-def get_total_hours_from_calendar_name(login):
+class CassetteMiss(Exception):
     """
-    Retorna las horas totales, si el nombre delo horario las menciona
+    La llamada no está en el cassette que se está reproduciendo
     """
-    user_id = get_user_id(login)
-    hours = None
-    calendar = login['conn'].execute_kw(login['db'],
-                                        login['uid'],
-                                        login['password'],
-                                        'hr.employee',
-                                        'search_read',
-                                        [[('id', '=',
-                                           user_id)]],
-                                        {'fields': ['calendar_id']})
-
-    if calendar[0]['calendar_id']:
-        calendar_name = calendar[0]['calendar_id'][-1]
-        cachos = calendar_name.split()
-        if len(cachos) > 1 and (cachos[1].lower() == "total" or cachos[1].lower() == "totales"):
+
+
+class Cassette:
+    """
+    Archivo (JSON por líneas, comprimido con gzip) con las llamadas RPC
+    (authenticate y execute_kw) y sus respuestas o errores. Las contraseñas
+    no se guardan.
+    Al grabar se escribe cada llamada según se hace; al reproducir se carga
+    entero y cada llamada devuelve, por orden, las respuestas grabadas para
+    los mismos argumentos (la última se repite si se piden más).
+    La primera línea guarda la hora de la grabación (now), que es la que
+    usan los informes mientras se graba y se reproduce.
+    """
+
+    def __init__(self, path, replay=False):
+        self.path = path
+        self.replay = replay
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.now = datetime.now().replace(microsecond=0)
+        if replay:
+            with gzip.open(path, 'rt', encoding='utf-8') as cassette:
+                for line in cassette:
+                    call = json.loads(line)
+                    if 'now' in call:
+                        self.now = datetime.fromtimestamp(call['now'])
+                    else:
+                        self.calls.setdefault(call['key'], []).append(call)
+            self.played = collections.Counter()
+            self.file = None
+        else:
+            self.file = gzip.open(path, 'wt', encoding='utf-8')
+            print(json.dumps({'now': self.now.timestamp()}), file=self.file)
+
+    @staticmethod
+    def key(service, method, args):
+        args = list(args)
+        if len(args) > 2 and method in ('authenticate', 'execute_kw'):
+            args[2] = '*'
+        return json.dumps([service, method, args], sort_keys=True)
+
+    def record(self, key, result=None, fault=None):
+        line = json.dumps({'key': key, 'result': result, 'fault': fault})
+        with self.lock:
+            print(line, file=self.file)
+
+    def play(self, key):
+        with self.lock:
+            calls = self.calls.get(key)
+            if not calls:
+                raise CassetteMiss('La llamada no está grabada en {}: {}'
+                                   .format(self.path, key[:200]))
+            call = calls[min(self.played[key], len(calls) - 1)]
+            self.played[key] += 1
+        if call['fault']:
+            raise xmlrpc.client.Fault(*call['fault'])
+        return call['result']
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+class CassetteProxy:
+    """
+    Con proxy, hace las llamadas y las graba en el cassette; sin proxy, las
+    sirve desde el cassette sin conectar con Odoo
+    """
+
+    def __init__(self, cassette, service, proxy=None):
+        self.cassette = cassette
+        self.service = service
+        self.proxy = proxy
+
+    def __getattr__(self, method):
+        if method.startswith('_'):
+            raise AttributeError(method)
+
+        def call(*args):
+            # Los None fallan en el cliente, antes de llegar a Odoo
+            check_marshallable(args)
+            key = self.cassette.key(self.service, method, args)
+            if self.proxy is None:
+                return self.cassette.play(key)
             try:
-                hours = float(cachos[0])
-            except ValueError:
-                pass
-    return hours
+                result = getattr(self.proxy, method)(*args)
+            except xmlrpc.client.Fault as e:
+                self.cassette.record(key, fault=[e.faultCode, e.faultString])
+                raise
+            self.cassette.record(key, result=result)
+            return result
+        return call
 
 
-def get_jornada(login):
+def start_cassette(path, replay=False):
     """
-    Retorna una lista con las IDs de las horas diarias del horario del trabajador
-    Necesita permisos
+    Graba (o, si replay, reproduce) en path las llamadas RPC de los proxies
+    que se creen desde ahora
     """
+    global rpc_cassette
+    rpc_cassette = Cassette(path, replay)
+    atexit.register(rpc_cassette.close)
 
-    horario_id = get_horario_id_employee(login)
 
-    if horario_id:
-        resp = login['conn'].execute_kw(
-            login['db'],
-            login['uid'],
-            login['password'],
-            'resource.calendar',
-            'search_read',
-            [[('id', '=',
-               horario_id)]],
-            {'fields': ['attendance_ids']})
+def start_profile(show_report=True, trace=None):
+    """
+    Activa el registro de llamadas RPC para los proxies que se creen desde
+    ahora. Al terminar el programa se muestra el informe por stderr (si
+    show_report) y se guardan las llamadas en trace (si se indica).
+    """
+    global rpc_profiler
+    rpc_profiler = RpcProfiler()
 
-        return resp[0]['attendance_ids']
+    def finish(profiler=rpc_profiler):
+        if show_report:
+            profiler.report(sys.stderr)
+        if trace:
+            profiler.dump(trace)
+    atexit.register(finish)
 
-    return None
 
+##################################################
+#
+# Todas estas funciones son para sacar el horario semanal
+#
+##################################################
+
+calendar_weeks = {}
 
-def get_week_labor_hours(login):
+
+def load_calendar_weeks(login, calendar_ids):
     """
-    Retorna una lista con las horas laborables de cada día de la semana.
-    Lunes es el cero, domingo el seis
+    Carga con un solo search_read los tramos (resource.calendar.attendance)
+    de varios horarios y guarda, por horario, las horas de cada día de la
+    semana. Si un día tiene varios tramos (jornada partida) se suman.
     Necesita permisos
     """
-    lista_ids = get_jornada(login)
+    pending = sorted({i for i in calendar_ids
+                      if i and (login['db'], i) not in calendar_weeks})
+    if not pending:
+        return
+    slots = login['conn'].execute_kw(
+        login['db'],
+        login['uid'],
+        login['password'],
+        'resource.calendar.attendance',
+        'search_read',
+        [[('calendar_id', 'in', pending)]],
+        {'fields': ['calendar_id', 'dayofweek', 'hour_from', 'hour_to']})
+    weeks = {(login['db'], i): [0] * 7 for i in pending}
+    for slot in slots:
+        week = weeks.get((login['db'], slot['calendar_id'] and
+                          slot['calendar_id'][0]))
+        if week is not None:
+            week[int(slot['dayofweek'])] += \
+                float(slot['hour_to']) - float(slot['hour_from'])
+    calendar_weeks.update(weeks)
 
-    horario_semana = [0] * 7
 
-    if lista_ids:
-        resp = login['conn'].execute_kw(
-            login['db'],
-            login['uid'],
-            login['password'],
-            'resource.calendar.attendance',
-            'search_read',
-            [[('id', 'in',
-               lista_ids)]],
-            {'fields': ['dayofweek', 'hour_from', 'hour_to']})
+calendar_years = MemoCache('calendar_years', 1024, MEMO_TTL,
+                           current_year_key)
 
-        for day in resp:
-            horario_semana[int(day['dayofweek'])] = float(day['hour_to']) - float(day['hour_from'])
 
-    return horario_semana
+def get_calendar_year(login, calendar_id, state_id, year):
+    """
+    Retorna una lista con las horas laborables de cada día del año (el 1 de
+    enero es el cero) de un horario en una provincia, con los festivos
+    nacionales y provinciales a cero.
+    Se calcula una vez por (horario, provincia, año) y lo comparten todos
+    los empleados; las ausencias de cada uno se aplican después.
+    """
+    key = (login['db'], calendar_id, state_id, year)
+    if key not in calendar_years:
+        week = [0] * 7
+        if calendar_id:
+            load_calendar_weeks(login, [calendar_id])
+            week = calendar_weeks[(login['db'], calendar_id)]
+        first = date(year, 1, 1)
+        days = date(year + 1, 1, 1).toordinal() - first.toordinal()
+        hours = [week[(first.weekday() + i) % 7] for i in range(days)]
+        table = get_holidays_table(login, year)
+        for state in (None, state_id):
+            for line in table['by_state'].get(state, []):
+                hours[day_of_year(line['date'])] = 0
+        calendar_years[key] = hours
+    return calendar_years[key]
+
+
+def day_of_year(day):
+    """
+    Posición (el 1 de enero es el cero) de una fecha "AAAA-MM-DD" en su año
+    """
+    day = date(*map(int, day[:10].split('-')))
+    return day.toordinal() - date(day.year, 1, 1).toordinal()
 
 
 def labor_hours_by_month_day(login, month=None, year=None):
     """
     Retorna un diccionario con las horas laborables de cada día del mes.
     {"2022-02-01": 8.0, ...}
+    Los festivos y los días de ausencia tienen cero horas; las ausencias de
+    parte de un día restan su duración.
     Necesita permisos
     """
     if year is None:
-        year = int(datetime.now().year)
+        year = int(get_now(login).year)
     if month is None:
-        month = int(datetime.now().month)
+        month = int(get_now(login).month)
 
-    week_labor_hours = get_week_labor_hours(login)
-
-    holidays = tuple(holidays_by_month(login, month, year))
-    vacations = tuple(get_vacances_by_month(login, month, year))
+    profile = get_employee_profile(login)
+    year_hours = get_calendar_year(
+        login, profile.calendar_id,
+        get_state_by_address(login, profile.address_id), year)
 
+    first = day_of_year("{}-{:02d}-01".format(year, month))
     labor_hours_by_day = {}
-    cal = calendar.Calendar()
-    weekday = 0
-    for day in cal.itermonthdays(year, month):
-        if day != 0:
-            key = "{}-{:02d}-{:02d}".format(year, month, day)
-            if key not in holidays and key not in vacations:
-                labor_hours_by_day["{}-{:02d}-{:02d}".format(year, month, day)] = week_labor_hours[weekday]
-        weekday += 1
-        if weekday == 7:
-            weekday = 0
+    for day in range(1, calendar.monthrange(year, month)[1] + 1):
+        labor_hours_by_day["{}-{:02d}-{:02d}".format(year, month, day)] = \
+            year_hours[first + day - 1]
+    start = datetime(year, month, 1)
+    end = datetime(year + month // 12, month % 12 + 1, 1)
+    apply_leaves(login, profile.id, labor_hours_by_day, start, end)
     return labor_hours_by_day
 
 
 def count_worked_hours_on_life(login, month=None, year=None):
+    """
+    Horas trabajadas desde siempre hasta final del mes (se cuentan las de la
+    sesión abierta si el mes es el corriente)
+    """
+    now = get_now(login)
+    if year is None:
+        year = now.year
+    if month is None:
+        month = now.month
     total = 0
-    if month == int(datetime.now().month) and year == int(datetime.now().year):
+    if month == now.month and year == now.year:
         total = open_session_worked_hours(login)
-    for e in get_user_attendance_on_life(login, month, year):
-        total += e[2]
+    return total + get_life_worked_hours(login, month, year)[0]
 
-    return total
+
+life_hours = MemoCache('life_hours', STORE_SIZE, MEMO_TTL, current_month_key)
 
 
-@memoize
-def get_user_attendance_on_life(login, month=None, year=None):
+def load_life_hours(login, employee_ids, month=None, year=None):
+    """
+    Suma en el servidor, con un read_group por cada bloque de
+    ATTENDANCE_CHUNK empleados, las horas y el número de asistencias de
+    cada empleado desde siempre hasta final del mes indicado.
+    """
+    if year is None:
+        year = int(get_now(login).year)
+    if month is None:
+        month = int(get_now(login).month)
+    pending = [i for i in employee_ids
+               if i and (login['db'], i, year, month) not in life_hours]
+    if not pending:
+        return
+    next_year, next_month = divmod(month, 12)
+    date_to = '{}-{:02d}-01 00:00:00'.format(year + next_year, next_month + 1)
+    totals = {}
+    for chunk in range(0, len(pending), ATTENDANCE_CHUNK):
+        totals.update(worked_hours_groups(
+            login, [('employee_id', 'in',
+                     pending[chunk:chunk + ATTENDANCE_CHUNK]),
+                    ('check_in', '<', date_to)]))
+    life_hours.update(((login['db'], i, year, month),
+                       totals.get((i, None), (0, 0))) for i in pending)
+
+
+def get_life_worked_hours(login, month=None, year=None):
+    """
+    Retorna (horas, asistencias) del usuario desde siempre hasta final del
+    mes indicado
+    """
     user_id = get_user_id(login)
+    if not user_id:
+        return 0, 0
     if year is None:
-        year = int(datetime.now().year)
+        year = int(get_now(login).year)
     if month is None:
-        month = int(datetime.now().month)
-    month += 1
-    if month == 13:
-        month = 1
-        year += 1
-    date_filter = "{}-{:02d}-01 00:00:00".format(year, month)
+        month = int(get_now(login).month)
+    load_life_hours(login, [user_id], month, year)
+    return life_hours[(login['db'], user_id, year, month)]
 
+
+def worked_hours_groups(login, domain, by_month=False):
+    """
+    Suma en el servidor (read_group) las horas trabajadas de las asistencias
+    de domain, agrupadas por empleado y, si by_month, por mes de entrada.
+    Retorna {(employee_id, "AAAA-MM" o None): (horas, asistencias)}.
+    Si el servidor no admite el read_group se suman en local, paginando.
+    """
+    groupby = ['employee_id', 'check_in:month'] if by_month \
+        else ['employee_id']
     try:
-        attendance = login['conn'].execute_kw(
+        groups = login['conn'].execute_kw(
+            login['db'],
+            login['uid'],
+            login['password'],
+            'hr.attendance',
+            'read_group',
+            [domain, ['employee_id', 'worked_hours'], groupby],
+            {'lazy': False, 'context': {'tz': 'UTC'}})
+    except xmlrpc.client.Fault:
+        return stream_worked_hours(login, domain, by_month)
+    totals = {}
+    for group in groups:
+        if not group['employee_id']:
+            continue
+        key = (group['employee_id'][0],
+               group_month(group, 'check_in') if by_month else None)
+        totals[key] = (group['worked_hours'] or 0, group['__count'])
+    return totals
+
+
+def group_month(group, field):
+    """
+    Mes ("AAAA-MM") de un grupo de read_group por field:month. La etiqueta
+    del grupo depende del idioma, así que se saca de su __domain: es el
+    mayor límite inferior de field (el __domain incluye también el dominio
+    de la consulta).
+    """
+    starts = [leaf[2] for leaf in group['__domain']
+              if isinstance(leaf, (list, tuple)) and leaf[0] == field and
+              leaf[1] == '>=']
+    return max(starts)[:7] if starts else None
+
+
+def stream_worked_hours(login, domain, by_month=False):
+    """
+    Como worked_hours_groups, pero descargando las asistencias por páginas
+    de ATTENDANCE_PAGE y sumando en local
+    """
+    totals = {}
+    offset = 0
+    while True:
+        page = login['conn'].execute_kw(
             login['db'],
             login['uid'],
             login['password'],
             'hr.attendance',
             'search_read',
-            [[('employee_id', '=', user_id),
-              ('check_in', '<', date_filter)
-              ]],
-            {'fields': ['employee_id', 'check_in', 'check_out',
-                        'worked_hours']})
-    except TypeError:
+            [domain],
+            {'fields': ['employee_id', 'check_in', 'worked_hours'],
+             'order': 'id', 'offset': offset, 'limit': ATTENDANCE_PAGE})
+        for e in page:
+            if not e['employee_id']:
+                continue
+            key = (e['employee_id'][0], e['check_in'][:7] if by_month else None)
+            hours, count = totals.get(key, (0, 0))
+            totals[key] = (hours + (e['worked_hours'] or 0), count + 1)
+        if len(page) < ATTENDANCE_PAGE:
+            return totals
+        offset += ATTENDANCE_PAGE
+
+
+########################################################################
+#
+# Caché local de periodos cerrados
+#
+########################################################################
+
+disk_cache = None
+
+
+class DiskCache:
+    """
+    Caché en disco (SQLite) de los datos de periodos cerrados: asistencias de
+    meses pasados, ausencias y festivos de años pasados...
+    Cada entrada se guarda por servidor, base de datos, modelo, empleado y
+    periodo. Si el archivo supera max_size bytes se borran las entradas
+    usadas hace más tiempo.
+    Con refresh=True no se lee nada de la caché, pero se guarda lo descargado.
+    Los cambios no se guardan en disco hasta llamar a commit (después de
+    cada lote de datos y al terminar el programa).
+    """
+
+    def __init__(self, path, max_size, refresh=False):
+        self.path = path
+        self.max_size = max_size
+        self.refresh = refresh
+        self.lock = threading.Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                server TEXT, db TEXT, model TEXT, employee INTEGER,
+                period TEXT, value TEXT, size INTEGER, accessed REAL,
+                PRIMARY KEY (server, db, model, employee, period))""")
+        self.conn.execute("""
+            CREATE INDEX IF NOT EXISTS entries_accessed
+            ON entries (accessed)""")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS sync_records (
+                server TEXT, db TEXT, model TEXT, record_id INTEGER,
+                employee INTEGER, periods TEXT, write_date TEXT,
+                PRIMARY KEY (server, db, model, record_id))""")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS sync_marks (
+                server TEXT, db TEXT, model TEXT, employee INTEGER,
+                write_date TEXT,
+                PRIMARY KEY (server, db, model, employee))""")
+        self.conn.commit()
+        # Tamaño total de las entradas, que se lleva al día en put e
+        # invalidate para no sumar la tabla entera en cada escritura
+        self.total = self.conn.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    def get(self, db, model, employee, period):
+        if self.refresh:
+            return None
+        key = (server, db, model, employee, str(period))
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT value FROM entries WHERE server=? AND db=? AND '
+                'model=? AND employee=? AND period=?', key).fetchone()
+            if row is None:
+                return None
+            self.conn.execute(
+                'UPDATE entries SET accessed=? WHERE server=? AND db=? AND '
+                'model=? AND employee=? AND period=?', (time.time(),) + key)
+        return json.loads(row[0])
+
+    def put(self, db, model, employee, period, value):
+        data = json.dumps(value, separators=(',', ':'))
+        key = (server, db, model, employee, str(period))
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT size FROM entries WHERE server=? AND db=? AND '
+                'model=? AND employee=? AND period=?', key).fetchone()
+            self.conn.execute(
+                'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, '
+                '?)', key + (data, len(data), time.time()))
+            self.total += len(data) - (row[0] if row else 0)
+            if self.total > self.max_size:
+                self.shrink()
+
+    def invalidate(self, db, model, employee, periods):
+        with self.lock:
+            for period in periods:
+                key = (server, db, model, employee, str(period))
+                row = self.conn.execute(
+                    'SELECT size FROM entries WHERE server=? AND db=? AND '
+                    'model=? AND employee=? AND period=?', key).fetchone()
+                if row:
+                    self.conn.execute(
+                        'DELETE FROM entries WHERE server=? AND db=? AND '
+                        'model=? AND employee=? AND period=?', key)
+                    self.total -= row[0]
+
+    def commit(self):
+        with self.lock:
+            self.conn.commit()
+
+    def get_mark(self, db, model, employee):
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT write_date FROM sync_marks WHERE server=? AND db=? '
+                'AND model=? AND employee=?',
+                (server, db, model, employee)).fetchone()
+        return row[0] if row else None
+
+    def set_mark(self, db, model, employee, write_date):
+        with self.lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO sync_marks VALUES (?, ?, ?, ?, ?)',
+                (server, db, model, employee, write_date))
+
+    def init_marks(self, db, model, employees, write_date):
+        """
+        Pone la marca a los empleados que aún no la tienen
+        """
+        with self.lock:
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO sync_marks VALUES (?, ?, ?, ?, ?)',
+                [(server, db, model, employee, write_date)
+                 for employee in employees])
+
+    def get_sync_records(self, db, model, employee):
+        """
+        {id: (periodos, write_date)} de los registros conocidos de un empleado
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT record_id, periods, write_date FROM sync_records '
+                'WHERE server=? AND db=? AND model=? AND employee=?',
+                (server, db, model, employee)).fetchall()
+        return {r[0]: (json.loads(r[1]), r[2]) for r in rows}
+
+    def get_sync_record(self, db, model, record_id):
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT employee, periods, write_date FROM sync_records '
+                'WHERE server=? AND db=? AND model=? AND record_id=?',
+                (server, db, model, record_id)).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1]), row[2]
+
+    def put_sync_records(self, db, model, rows):
+        """
+        Guarda [(id, empleado, periodos, write_date)] en sync_records
+        """
+        with self.lock:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO sync_records VALUES '
+                '(?, ?, ?, ?, ?, ?, ?)',
+                [(server, db, model, record_id, employee, json.dumps(periods),
+                  write_date)
+                 for record_id, employee, periods, write_date in rows])
+
+    def delete_sync_records(self, db, model, record_ids):
+        with self.lock:
+            self.conn.executemany(
+                'DELETE FROM sync_records WHERE server=? AND db=? AND '
+                'model=? AND record_id=?',
+                [(server, db, model, i) for i in record_ids])
+
+    def shrink(self):
+        """
+        Borra las entradas menos usadas hasta quedar por debajo de max_size
+        """
+        rows = self.conn.execute(
+            'SELECT rowid, size FROM entries ORDER BY accessed')
+        for rowid, size in rows.fetchall():
+            self.conn.execute('DELETE FROM entries WHERE rowid=?', (rowid,))
+            self.total -= size
+            if self.total <= self.max_size:
+                break
+
+
+def open_disk_cache(refresh=False):
+    """
+    Abre la caché local. La ruta y el tamaño máximo (en MB) se toman de las
+    variables de entorno ODOOCLI_CACHE_DIR y ODOOCLI_CACHE_SIZE.
+    Si no se puede abrir se trabaja sin caché.
+    """
+    cache_dir = os.environ.get('ODOOCLI_CACHE_DIR') or os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+        'odoocli')
+    max_size = float(os.environ.get('ODOOCLI_CACHE_SIZE') or 100)
+    try:
+        cache = DiskCache(os.path.join(cache_dir, 'cache.sqlite'),
+                          int(max_size * 1024 * 1024), refresh)
+    except (OSError, sqlite3.Error) as e:
+        print('No se puede usar la caché local:', e, file=sys.stderr)
         return None
+    atexit.register(cache.commit)
+    return cache
+
+
+def closed_period(period):
+    """
+    Indica si un periodo ('2022' o '2022-03') ya ha terminado
+    """
+    now = datetime.now()
+    current = '{}-{:02d}'.format(now.year, now.month)
+    return str(period) < current[:len(str(period))]
+
+
+def disk_cache_get(login, model, employee, period):
+    if disk_cache is None or not closed_period(period):
+        return None
+    return disk_cache.get(login['db'], model, employee, period)
+
+
+def disk_cache_put(login, model, employee, period, value):
+    if disk_cache is not None and closed_period(period):
+        disk_cache.put(login['db'], model, employee, period, value)
+
+
+def disk_cache_commit():
+    """
+    Guarda en disco lo escrito en la caché local desde el último commit
+    """
+    if disk_cache is not None:
+        disk_cache.commit()
+
+
+# Modelos que se sincronizan: (modelo, campo de empleado, campos que se
+# guardan en la caché local, dominio de los registros que se guardan)
+SYNC_MODELS = (
+    ('hr.attendance', 'employee_id',
+     ['check_in', 'check_out', 'worked_hours'], []),
+    ('hr.holidays', 'employee_id',
+     ['date_from', 'date_to', 'number_of_days_temp'],
+     [('state', '!=', 'refuse')]),
+    ('hr.holidays.public.line', None, ['name', 'date', 'state_ids'], []),
+)
+
+
+def sync_periods(model, record):
+    """
+    Periodos de la caché local a los que afecta un registro
+    """
+    if model == 'hr.attendance':
+        return [record['check_in'][:7]] if record['check_in'] else []
+    if model == 'hr.holidays':
+        if not record['date_from'] or not record['date_to']:
+            return []
+        # Mismo margen de un día que se usa en load_leaves
+        return [str(year) for year in range(int(record['date_from'][:4]) - 1,
+                                             int(record['date_to'][:4]) + 2)
+                if record['date_from'] <= '{}-01-01 23:59:59'.format(year + 1)
+                and record['date_to'] >= '{}-12-31 00:00:00'.format(year - 1)]
+    return [record['date'][:4]] if record['date'] else []
+
+
+def sync_row(model, record):
+    """
+    Fila de un registro tal como se guarda en la caché local (la misma que
+    guardan load_attendance, load_leaves y get_holidays_table)
+    """
+    if model == 'hr.attendance':
+        return [record['check_in'], record['check_out'],
+                record['worked_hours'], record['id']]
+    if model == 'hr.holidays':
+        return [record['date_from'], record['date_to'],
+                record['number_of_days_temp'] or 0, record['id']]
+    return {'id': record['id'], 'name': record['name'],
+            'date': record['date'], 'state_ids': record['state_ids']}
+
+
+def sync_row_id(model, row):
+    """
+    Id del registro de una fila de la caché local, o None si la fila es de
+    un formato antiguo sin id
+    """
+    if model == 'hr.holidays.public.line':
+        return row.get('id')
+    return row[3] if len(row) == 4 else None
+
+
+def sync_record_loaded(login, model, owners, records):
+    """
+    Anota en sync_records los registros recién descargados (id, empleado,
+    periodos y write_date), para que --sync sepa ya dónde está cada uno y
+    no tenga que volver a pedirlos. A los empleados del lote que aún no
+    tienen marca se les pone la write_date más reciente del lote: todo lo
+    que cambie a partir de ahora tendrá una posterior.
+    Si un registro conocido ha cambiado desde la última sincronización se
+    quita de los periodos donde estaba antes.
+    """
+    if disk_cache is None:
+        return
+    db = login['db']
+    known = {}
+    for owner in owners:
+        known.update((record_id, (owner,) + value) for record_id, value
+                     in disk_cache.get_sync_records(db, model, owner).items())
+    rows = []
+    for record in records:
+        owner = record['employee_id'][0] if 'employee_id' in record else 0
+        periods = sync_periods(model, record)
+        old = known.get(record['id'])
+        if old and old[2] != record['write_date'] \
+                and set(old[1]) - set(periods):
+            sync_merge(db, model, record['id'], old, owner, record)
+            continue
+        rows.append((record['id'], owner, periods, record['write_date']))
+    disk_cache.put_sync_records(db, model, rows)
+    if records:
+        disk_cache.init_marks(db, model, owners,
+                              max(record['write_date'] for record in records))
+
+
+def sync_merge(db, model, record_id, known, owner, record):
+    """
+    Aplica un registro nuevo o modificado (record), o borrado (None), sobre
+    los periodos de la caché local donde estaba (known: empleado, periodos
+    y write_date en sync_records, o None) y donde está ahora: se quita la
+    fila antigua y se añade la nueva. Sólo se tocan los periodos que ya
+    están en la caché; los que tienen filas sin id (de versiones
+    anteriores) se borran para que se vuelvan a descargar.
+    Retorna los periodos tocados como (modelo, empleado, periodo).
+    """
+    old = {(known[0], period) for period in known[1]} if known else set()
+    new = {(owner, period) for period in sync_periods(model, record)} \
+        if record else set()
+    touched = set()
+    for employee, period in old | new:
+        rows = None if disk_cache.refresh else \
+            disk_cache.get(db, model, employee, period)
+        if rows is None or any(sync_row_id(model, row) is None
+                               for row in rows):
+            disk_cache.invalidate(db, model, employee, [period])
+            if rows is not None:
+                touched.add((model, employee, period))
+            continue
+        rows = [row for row in rows if sync_row_id(model, row) != record_id]
+        if (employee, period) in new:
+            rows.append(sync_row(model, record))
+        if model == 'hr.attendance':
+            # Mismo orden que devuelve Odoo: de la más reciente a la más
+            # antigua
+            rows.sort(key=lambda row: row[0], reverse=True)
+        disk_cache.put(db, model, employee, period, rows)
+        touched.add((model, employee, period))
+    if record:
+        disk_cache.put_sync_records(db, model, [(
+            record_id, owner, sorted(period for employee, period in new),
+            record['write_date'])])
     else:
-        for e in attendance:
-            yield e['check_in'], e['check_out'], e['worked_hours']
+        disk_cache.delete_sync_records(db, model, [record_id])
+    return touched
+
+
+def sync_disk_cache(login, employee_ids):
+    """
+    Sincronización incremental de la caché local.
+    Para cada modelo de SYNC_MODELS pide a Odoo sólo los registros
+    modificados (write_date) desde la marca de cada empleado, que se pone al
+    descargar sus datos y en cada sincronización, y detecta los borrados
+    comparando el número de registros con los conocidos y, si no coincide,
+    el conjunto de ids (los que aún no se conocían se anotan entonces).
+    Cada cambio se aplica sobre los periodos cerrados que ya estén en la
+    caché (se añade, sustituye o quita el registro), sin descartarlos.
+    Retorna el número de periodos actualizados.
+    """
+    if disk_cache is None:
+        return 0
+    db = login['db']
+    updated = set()
+    for model, employee_field, fields, filters in SYNC_MODELS:
+        owners = [i for i in employee_ids if i] if employee_field else [0]
+        # Altas y modificaciones. Los empleados sin marca se piden enteros;
+        # el resto, desde la marca más antigua de cada bloque (lo que ya se
+        # conoce con la misma write_date se descarta)
+        marks = {owner: disk_cache.get_mark(db, model, owner)
+                 for owner in owners}
+        groups = [[owner for owner in owners if not marks[owner]],
+                  [owner for owner in owners if marks[owner]]]
+        new_marks = {}
+        for group in groups:
+            for chunk in range(0, len(group), ATTENDANCE_CHUNK):
+                chunk_owners = group[chunk:chunk + ATTENDANCE_CHUNK]
+                mark = min(marks[owner] or '' for owner in chunk_owners)
+                for record in sync_fetch(login, model, employee_field, fields,
+                                         filters, chunk_owners, mark):
+                    owner = record[employee_field][0] if employee_field else 0
+                    if new_marks.get(owner, '') < record['write_date']:
+                        new_marks[owner] = record['write_date']
+                    updated.update(sync_apply(db, model, owner, record))
+
+        # Bajas y registros que aún no se conocían: se piden enteros los
+        # empleados cuyo número de registros no coincide
+        counts = sync_server_counts(login, model, employee_field, filters,
+                                    owners)
+        known = {owner: disk_cache.get_sync_records(db, model, owner)
+                 for owner in owners}
+        mismatched = [owner for owner in owners
+                      if counts.get(owner, 0) != len(known[owner])]
+        for chunk in range(0, len(mismatched), ATTENDANCE_CHUNK):
+            chunk_owners = mismatched[chunk:chunk + ATTENDANCE_CHUNK]
+            ids = set()
+            for record in sync_fetch(login, model, employee_field, fields,
+                                     filters, chunk_owners):
+                ids.add(record['id'])
+                owner = record[employee_field][0] if employee_field else 0
+                if new_marks.get(owner, '') < record['write_date']:
+                    new_marks[owner] = record['write_date']
+                updated.update(sync_apply(db, model, owner, record))
+            for owner in chunk_owners:
+                for record_id in set(known[owner]) - ids:
+                    updated.update(sync_merge(
+                        db, model, record_id,
+                        (owner,) + known[owner][record_id], owner, None))
+
+        for owner, mark in new_marks.items():
+            disk_cache.set_mark(db, model, owner,
+                                max(mark, marks[owner] or ''))
+        # Los empleados sin registros toman la marca más reciente vista, para
+        # no pedirlos enteros en cada sincronización
+        if new_marks:
+            disk_cache.init_marks(db, model, groups[0],
+                                  max(new_marks.values()))
+        disk_cache.commit()
+    return len(updated)
+
+
+def sync_fetch(login, model, employee_field, fields, filters, owners,
+               mark=None):
+    """
+    Registros de un modelo de SYNC_MODELS de varios empleados, todos o sólo
+    los modificados desde mark
+    """
+    domain = list(filters)
+    if employee_field:
+        domain.append((employee_field, 'in', owners))
+    if mark:
+        domain.append(('write_date', '>=', mark))
+    return login['conn'].execute_kw(
+        login['db'], login['uid'], login['password'], model, 'search_read',
+        [domain],
+        {'fields': ([employee_field] if employee_field else []) + fields
+         + ['write_date']})
+
+
+def sync_apply(db, model, owner, record):
+    """
+    Aplica un registro descargado por sync_fetch si no se conocía o si ha
+    cambiado su write_date
+    """
+    known = disk_cache.get_sync_record(db, model, record['id'])
+    if known and known[2] == record['write_date']:
+        return set()
+    return sync_merge(db, model, record['id'], known, owner, record)
+
+
+def sync_server_counts(login, model, employee_field, filters, owners):
+    """
+    Número de registros de cada empleado en el servidor
+    """
+    if not employee_field:
+        return {0: login['conn'].execute_kw(
+            login['db'], login['uid'], login['password'], model,
+            'search_count', [list(filters)])}
+    counts = {}
+    for chunk in range(0, len(owners), ATTENDANCE_CHUNK):
+        groups = login['conn'].execute_kw(
+            login['db'], login['uid'], login['password'], model,
+            'read_group',
+            [list(filters) +
+             [(employee_field, 'in', owners[chunk:chunk + ATTENDANCE_CHUNK])],
+             [employee_field], [employee_field]],
+            {'lazy': False})
+        for group in groups:
+            if group[employee_field]:
+                counts[group[employee_field][0]] = group['__count']
+    return counts
 
 
 ########################################################################
@@ -1036,7 +3300,7 @@ Si se usa el flag --list se mostrará un listado de asistencias en lugar del
 resumen.
 
 Con --file NOMBRE_DE ARCHIVO se guarará el listado de asistencias en un archivo
-en formato CSV.
+en formato CSV. Si el nombre termina en .gz se guarda comprimido con gzip.
 
 Si existen las variables de entorno "ODOOCLIUSER" y "ODOOCLIPASS", se usarán
 para el login en Odoo a menos que se indique un usuario con el argumento
@@ -1080,8 +3344,48 @@ mostrará un prompt solicitando la contraseña.
                         enero en lugar del resumen habitual')
     parser.add_argument('-t', '--today', action='count',
                         help='Muestra las horas trabajadas hoy.')
+    parser.add_argument('--no-cache', action='count',
+                        help='No usa la caché local de periodos cerrados')
+    parser.add_argument('--refresh', action='count',
+                        help='Vuelve a descargar los periodos cerrados y \
+                        actualiza la caché local')
+    parser.add_argument('--sync', action='count',
+                        help='Antes del informe, trae de Odoo sólo los \
+                        cambios hechos desde la última sincronización y \
+                        los aplica sobre los periodos guardados en la caché \
+                        local, sin volver a descargarlos')
+    parser.add_argument('--rpc', choices=('xmlrpc', 'jsonrpc'),
+                        default=rpc_backend,
+                        help='Protocolo para hablar con Odoo (por defecto \
+                        el de la variable de entorno "ODOOCLI_RPC" o xmlrpc)')
+    parser.add_argument('--profile', action='count',
+                        help='Al terminar muestra (por stderr) cuántas llamadas \
+                        RPC se han hecho, su tiempo total y p95 y sus bytes, por \
+                        modelo y método y por función')
+    parser.add_argument('--trace', type=str, metavar='FILE',
+                        help='Guarda todas las llamadas RPC en FILE, una por \
+                        línea en JSON')
+    parser.add_argument('--record', type=str, metavar='FILE',
+                        help='Graba en FILE todas las llamadas a Odoo y sus \
+                        respuestas (sin contraseñas), para reproducirlas \
+                        después con --replay. No usa la caché local')
+    parser.add_argument('--replay', type=str, metavar='FILE',
+                        help='Responde a las llamadas con las grabadas en FILE \
+                        con --record, sin conectar con Odoo. No usa la caché \
+                        local')
     args = parser.parse_args()
 
+    rpc_backend = args.rpc
+
+    if args.profile or args.trace:
+        start_profile(bool(args.profile), args.trace)
+
+    if args.record or args.replay:
+        start_cassette(args.replay or args.record, bool(args.replay))
+
+    if not args.no_cache and not (args.record or args.replay):
+        disk_cache = open_disk_cache(bool(args.refresh))
+
     if args.user:
         username = args.user
         password = getpass.getpass()
@@ -1095,7 +3399,7 @@ mostrará un prompt solicitando la contraseña.
         username = input('Username: ')
         password = getpass.getpass()
 
-    common = xmlrpc.client.ServerProxy('{}/xmlrpc/2/common'.format(server))
+    common = common_proxy()
     try:
         uid = common.authenticate(db, username, password, {})
     except TimeoutError:
@@ -1104,11 +3408,14 @@ mostrará un prompt solicitando la contraseña.
     if uid:
         login_data = {'db': db, 'password': password, 'username': username,
                       'uid': uid,
-                      'conn': xmlrpc.client.ServerProxy(
-                          '{}/xmlrpc/2/object'.format(server))}
+                      'conn': object_proxy()}
     else:
         sys.exit('Error en el Login')
 
+    if args.sync:
+        print('Periodos actualizados:',
+              sync_disk_cache(login_data, [get_user_id(login_data)]))
+
     current_month, current_year = get_args_date(args.month, args.year)
 
     if args.today:
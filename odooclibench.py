@@ -0,0 +1,632 @@
+#!/usr/bin/env python3
+
+import argparse
+import calendar
+import contextlib
+import getpass
+import gzip
+import importlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import xmlrpc.client
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+help_text = """
+Pruebas de rendimiento de odoocli.
+
+codecs: compara, sobre un mismo conjunto de asistencias, el tamaño de la
+respuesta y el tiempo de decodificación de XML-RPC y de JSON-RPC.
+
+reports: arranca un Odoo falso local con datos sintéticos y ejecuta contra él
+los informes reales de odoocli (show_resume_now, year_summary, list_to_csv,
+bulk y el resumen --org), midiendo tiempo, número de llamadas RPC y bytes.
+"""
+epilog_text = """
+codecs usa por defecto asistencias sintéticas (--rows filas). Con --live se
+usan las asistencias reales del usuario (las credenciales se toman igual que
+en odoocli.py).
+
+reports crea --employees empleados con asistencias desde enero del año
+anterior, y el servidor espera --latency milisegundos antes de cada respuesta.
+Cada informe tiene un presupuesto de llamadas RPC: si alguno lo supera el
+programa termina con error, así que sirve para detectar regresiones en el
+número de consultas.
+"""
+
+
+def synthetic_attendance(rows, seed=1):
+    """
+    Resultado de un search_read de hr.attendance con filas sintéticas
+    """
+    rnd = random.Random(seed)
+    start = datetime(2015, 1, 1, 7, 0)
+    result = []
+    for i in range(rows):
+        check_in = start + timedelta(days=i // 2, hours=7 * (i % 2),
+                                     minutes=rnd.randrange(60))
+        check_out = check_in + timedelta(hours=3, minutes=rnd.randrange(240))
+        result.append({
+            'id': i + 1,
+            'employee_id': [1 + i % 50, 'Empleado {}'.format(1 + i % 50)],
+            'check_in': check_in.strftime('%Y-%m-%d %H:%M:%S'),
+            'check_out': check_out.strftime('%Y-%m-%d %H:%M:%S'),
+            'worked_hours': (check_out - check_in).total_seconds() / 3600})
+    return result
+
+
+def live_attendance():
+    """
+    Asistencias reales (toda la historia) del usuario logeado
+    """
+    import odoocli
+
+    user = os.environ.get('ODOOCLIUSER') or input('Username: ')
+    password = os.environ.get('ODOOCLIPASS') or getpass.getpass()
+    uid = odoocli.common_proxy().authenticate(odoocli.db, user, password, {})
+    if not uid:
+        raise SystemExit('Error en el Login')
+    login = {'db': odoocli.db, 'password': password, 'username': user,
+             'uid': uid, 'conn': odoocli.object_proxy()}
+    return login['conn'].execute_kw(
+        login['db'], login['uid'], login['password'],
+        'hr.attendance', 'search_read',
+        [[('employee_id', '=', odoocli.get_user_id(login))]],
+        {'fields': ['employee_id', 'check_in', 'check_out', 'worked_hours']})
+
+
+def encode_xmlrpc(result):
+    return xmlrpc.client.dumps((result,), methodresponse=True,
+                               allow_none=True).encode()
+
+
+def decode_xmlrpc(data):
+    return xmlrpc.client.loads(data)[0][0]
+
+
+def encode_jsonrpc(result):
+    return json.dumps({'jsonrpc': '2.0', 'id': 1, 'result': result}).encode()
+
+
+def decode_jsonrpc(data):
+    return json.loads(data)['result']
+
+
+def best_time(func, data, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        func(data)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def compare_codecs(result, repeat=5):
+    """
+    Tamaño (en claro y con gzip) y tiempo de decodificación de la misma
+    respuesta en XML-RPC y en JSON-RPC
+    """
+    rows = []
+    for name, encode, decode in (('xmlrpc', encode_xmlrpc, decode_xmlrpc),
+                                 ('jsonrpc', encode_jsonrpc, decode_jsonrpc)):
+        data = encode(result)
+        if decode(data) != result:
+            raise SystemExit('{}: los datos decodificados no coinciden'
+                             .format(name))
+        rows.append((name, len(data), len(gzip.compress(data)),
+                     best_time(decode, data, repeat)))
+    return rows
+
+
+def print_codecs(rows, records):
+    print('{} registros'.format(records))
+    print('Backend  | Bytes       | Bytes gzip  | Decodificación')
+    for name, size, gz_size, seconds in rows:
+        print('{:8} | {:11} | {:11} | {:10.1f} ms'.format(
+            name, size, gz_size, seconds * 1000))
+    base = rows[0]
+    for name, size, gz_size, seconds in rows[1:]:
+        print('{} / {}: {:.0%} del tamaño, {:.0%} del tiempo'.format(
+            name, base[0], size / base[1], seconds / base[3]))
+
+
+class FakeOdoo:
+    """
+    Odoo falso con datos sintéticos en memoria: sólo los modelos, campos y
+    métodos (search_read, read, search, search_count y read_group) que usa
+    odoocli. Un empleado de cada cuatro tiene jornada partida, otro horas
+    mensuales y otro horas totales; uno de cada nueve no tiene asistencias.
+    """
+
+    def __init__(self, employees=50, years=None, seed=1, today=None):
+        self.rnd = random.Random(seed)
+        self.today = today or date.today()
+        self.models = {}
+        self.build(employees, years or (self.today.year - 1, self.today.year))
+
+    def add(self, model, rec):
+        table = self.models.setdefault(model, {})
+        rec.setdefault('id', len(table) + 1)
+        rec.setdefault('write_date', '2020-01-01 00:00:00')
+        table[rec['id']] = rec
+        return rec
+
+    def build(self, employees, years):
+        for sid, name in ((1, 'Sevilla'), (2, 'Madrid')):
+            self.add('res.country.state', {'id': sid, 'name': name})
+        for pid in (1, 2):
+            self.add('res.partner', {'id': pid, 'name': 'Sede {}'.format(pid),
+                                     'state_id': pid})
+        cal_specs = ((1, '40 horas', [(d, 8, 15) for d in range(5)]),
+                     (2, 'Partida', [(d, 8, 13) for d in range(5)]
+                      + [(d, 15, 18) for d in range(4)]),
+                     (3, '60 mensuales', []),
+                     (4, '1000 totales', []))
+        for cid, name, slots in cal_specs:
+            ids = []
+            for dow, h_from, h_to in slots:
+                rec = self.add('resource.calendar.attendance', {
+                    'calendar_id': cid, 'dayofweek': str(dow),
+                    'hour_from': float(h_from), 'hour_to': float(h_to)})
+                ids.append(rec['id'])
+            self.add('resource.calendar', {'id': cid, 'name': name,
+                                           'attendance_ids': ids})
+        for year in years:
+            hol = self.add('hr.holidays.public', {'year': year,
+                                                  'line_ids': []})
+            for month, day, states in ((1, 1, []), (1, 6, []), (2, 28, [1]),
+                                       (5, 2, [2]), (8, 15, []),
+                                       (10, 12, []), (12, 8, []),
+                                       (12, 25, [])):
+                line = self.add('hr.holidays.public.line', {
+                    'name': 'Festivo', 'date': '{}-{:02d}-{:02d}'.format(
+                        year, month, day),
+                    'state_ids': states, 'year_id': hol['id']})
+                hol['line_ids'].append(line['id'])
+        self.add('res.users', {'id': 1, 'login': 'admin',
+                               'email': 'admin@example.com',
+                               'display_name': 'Admin', 'password': 'admin'})
+        first = date(min(years), 1, 1)
+        last = self.today
+        for n in range(employees):
+            uid = n + 2
+            email = 'user{}@example.com'.format(n)
+            self.add('res.users', {'id': uid, 'login': email, 'email': email,
+                                   'display_name': 'Usuario {}'.format(n),
+                                   'password': 'x'})
+            cal = (n % 4) + 1 if n % 7 else 1
+            emp = self.add('hr.employee', {
+                'id': n + 1, 'name': 'Usuario {}'.format(n), 'user_id': uid,
+                'calendar_id': cal, 'address_id': (n % 2) + 1})
+            if n % 9 == 8:
+                # Empleado sin ninguna asistencia
+                continue
+            day = first
+            while day <= last:
+                if day.weekday() < 5 or day == self.today:
+                    self.add_day(emp['id'], day)
+                day += timedelta(days=1)
+            for year in years:
+                start = date(year, 7, 1 + n % 20)
+                self.add('hr.holidays', {
+                    'employee_id': emp['id'], 'state': 'validate',
+                    'date_from': '{} 07:00:00'.format(start),
+                    'date_to': '{} 16:00:00'.format(start + timedelta(days=6)),
+                    'number_of_days_temp': 5,
+                    'holiday_type': 'employee', 'type': 'remove'})
+                # Un día completo (Odoo lo crea de 8 horas) y dos horas
+                self.add('hr.holidays', {
+                    'employee_id': emp['id'], 'state': 'validate',
+                    'date_from': '{}-02-0{} 07:00:00'.format(year, 2 + n % 5),
+                    'date_to': '{}-02-0{} 15:00:00'.format(year, 2 + n % 5),
+                    'number_of_days_temp': 1,
+                    'holiday_type': 'employee', 'type': 'remove'})
+                self.add('hr.holidays', {
+                    'employee_id': emp['id'], 'state': 'validate',
+                    'date_from': '{}-02-1{} 07:00:00'.format(year, 2 + n % 5),
+                    'date_to': '{}-02-1{} 09:00:00'.format(year, 2 + n % 5),
+                    'number_of_days_temp': 0.25,
+                    'holiday_type': 'employee', 'type': 'remove'})
+                self.add('hr.holidays', {
+                    'employee_id': emp['id'], 'state': 'refuse',
+                    'date_from': '{}-03-03 07:00:00'.format(year),
+                    'date_to': '{}-03-03 16:00:00'.format(year),
+                    'number_of_days_temp': 1,
+                    'holiday_type': 'employee', 'type': 'remove'})
+
+    def add_day(self, employee_id, day):
+        start = datetime(day.year, day.month, day.day, 6,
+                         self.rnd.randrange(0, 50))
+        if day == self.today:
+            self.add('hr.attendance', {'employee_id': employee_id,
+                                       'check_in': str(start),
+                                       'check_out': False,
+                                       'worked_hours': 0.0})
+            return
+        end = start + timedelta(hours=7, minutes=self.rnd.randrange(0, 60))
+        self.add('hr.attendance', {
+            'employee_id': employee_id, 'check_in': str(start),
+            'check_out': str(end),
+            'worked_hours': (end - start).total_seconds() / 3600})
+
+    M2O = {'employee_id': 'hr.employee', 'user_id': 'res.users',
+           'calendar_id': 'resource.calendar', 'address_id': 'res.partner',
+           'state_id': 'res.country.state', 'year_id': 'hr.holidays.public'}
+
+    def name_of(self, model, rid):
+        rec = self.models.get(model, {}).get(rid)
+        if rec is None:
+            return False
+        return [rid, rec.get('name') or rec.get('display_name') or '']
+
+    def value(self, rec, field):
+        value = rec.get(field, False)
+        if field in self.M2O:
+            return self.name_of(self.M2O[field], value) if value else False
+        return value
+
+    @staticmethod
+    def match(rec, domain):
+        for leaf in domain:
+            if not isinstance(leaf, (list, tuple)):
+                continue
+            field, op, value = leaf
+            current = rec.get(field, False)
+            if field == 'active' and current is False:
+                current = True
+            if op == '=':
+                ok = current == value
+            elif op == '!=':
+                ok = current != value
+            elif op == 'in':
+                ok = current in value
+            elif op == 'not in':
+                ok = current not in value
+            elif op == '=like':
+                ok = isinstance(current, str) and \
+                    current.startswith(value.rstrip('%'))
+            elif current is False or current is None:
+                ok = False
+            elif op == '<':
+                ok = current < value
+            elif op == '<=':
+                ok = current <= value
+            elif op == '>':
+                ok = current > value
+            elif op == '>=':
+                ok = current >= value
+            else:
+                raise xmlrpc.client.Fault(1, 'Operador no soportado ' + op)
+            if not ok:
+                return False
+        return True
+
+    def records(self, model, domain):
+        if model not in self.models:
+            raise xmlrpc.client.Fault(2, 'Modelo desconocido ' + model)
+        return [r for r in self.models[model].values()
+                if self.match(r, domain)]
+
+    DEFAULT_ORDER = {'hr.attendance': 'check_in desc'}
+
+    def sort(self, model, recs, order):
+        order = order or self.DEFAULT_ORDER.get(model, 'id')
+        for part in reversed(order.split(',')):
+            field, _, direction = part.strip().partition(' ')
+            recs = sorted(recs, key=lambda r: r.get(field) or '',
+                          reverse=direction.strip().lower() == 'desc')
+        return recs
+
+    def project(self, model, recs, fields):
+        if not fields:
+            fields = sorted({k for r in recs for k in r} - {'password'})
+        result = []
+        for rec in recs:
+            row = {'id': rec['id']}
+            for field in fields:
+                row[field] = self.value(rec, field)
+            result.append(row)
+        return result
+
+    def execute_kw(self, model, method, args, kwargs):
+        kwargs = dict(kwargs or {})
+        kwargs.pop('context', None)
+        if method == 'search_read':
+            domain = args[0] if args else kwargs.get('domain', [])
+            fields = args[1] if len(args) > 1 else kwargs.get('fields')
+            recs = self.sort(model, self.records(model, domain),
+                             kwargs.get('order'))
+            offset = kwargs.get('offset', 0)
+            limit = kwargs.get('limit')
+            recs = recs[offset:offset + limit if limit else None]
+            return self.project(model, recs, fields)
+        if method == 'read':
+            ids = args[0]
+            fields = args[1] if len(args) > 1 else kwargs.get('fields')
+            table = self.models[model]
+            return self.project(model, [table[i] for i in ids if i in table],
+                                fields)
+        if method == 'search':
+            return [r['id'] for r in self.records(model, args[0])]
+        if method == 'search_count':
+            return len(self.records(model, args[0]))
+        if method == 'read_group':
+            return self.read_group(model, *args, **kwargs)
+        raise xmlrpc.client.Fault(3, 'Método no soportado ' + method)
+
+    def read_group(self, model, domain, fields, groupby, offset=0,
+                   limit=None, orderby=False, lazy=True):
+        if isinstance(groupby, str):
+            groupby = [groupby]
+        sums = [f.split(':')[0] for f in fields if f.split(':')[0]
+                not in [g.split(':')[0] for g in groupby]]
+        groups = {}
+        for rec in self.records(model, domain):
+            key = []
+            for g in groupby:
+                field, _, gran = g.partition(':')
+                value = rec.get(field, False)
+                if gran == 'month' and value:
+                    value = value[:7]
+                key.append(value)
+            groups.setdefault(tuple(key), []).append(rec)
+        result = []
+        for key, recs in sorted(groups.items(), key=lambda i: str(i[0])):
+            row = {'__count': len(recs), '__domain': list(domain)}
+            for g, value in zip(groupby, key):
+                field, _, gran = g.partition(':')
+                if gran == 'month':
+                    year, month = map(int, value.split('-'))
+                    row[g] = '{} {}'.format(calendar.month_name[month], year)
+                    nxt = date(year + month // 12, month % 12 + 1, 1)
+                    row['__domain'] = row['__domain'] + [
+                        '&', (field, '>=', '{}-01 00:00:00'.format(value)),
+                        (field, '<', '{} 00:00:00'.format(nxt))]
+                else:
+                    row[field] = self.value(recs[0], field)
+            for field in sums:
+                row[field] = sum(r.get(field) or 0 for r in recs)
+            result.append(row)
+        return result
+
+
+class Counters:
+    """
+    Llamadas y bytes que ha recibido y enviado el servidor falso
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.by_method = {}
+
+    def add(self, key, size_in, size_out):
+        with self.lock:
+            self.calls += 1
+            self.bytes_in += size_in
+            self.bytes_out += size_out
+            self.by_method[key] = self.by_method.get(key, 0) + 1
+
+
+def make_handler(odoo, counters, latency):
+    """
+    Manejador HTTP que atiende XML-RPC (/xmlrpc/2/common y /xmlrpc/2/object)
+    y JSON-RPC (/jsonrpc) con los datos de odoo, esperando latency segundos
+    antes de cada respuesta
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers['Content-Length']))
+            self.last_key = None
+            if self.path == '/jsonrpc':
+                payload = json.loads(body)
+                params = payload['params']
+                try:
+                    result = self.dispatch(params['service'],
+                                           params['method'], params['args'])
+                    response = {'jsonrpc': '2.0', 'id': payload.get('id'),
+                                'result': result}
+                except xmlrpc.client.Fault as e:
+                    response = {'jsonrpc': '2.0', 'id': payload.get('id'),
+                                'error': {'code': 200,
+                                          'message': 'Odoo Server Error',
+                                          'data': {'message': e.faultString}}}
+                data = json.dumps(response).encode()
+                ctype = 'application/json'
+            else:
+                params, method = xmlrpc.client.loads(body)
+                service = self.path.rstrip('/').split('/')[-1]
+                try:
+                    result = self.dispatch(service, method, params)
+                    data = xmlrpc.client.dumps((result,), methodresponse=True,
+                                               allow_none=True)
+                except xmlrpc.client.Fault as e:
+                    data = xmlrpc.client.dumps(e, methodresponse=True)
+                data = data.encode()
+                ctype = 'text/xml'
+            counters.add(self.last_key, len(body), len(data))
+            if latency:
+                time.sleep(latency)
+            self.send_response(200)
+            self.send_header('Content-Type', ctype)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def dispatch(self, service, method, args):
+            if service == 'common':
+                self.last_key = 'common.' + method
+                if method == 'authenticate':
+                    for user in odoo.models['res.users'].values():
+                        if user['login'] == args[1] and \
+                                user['password'] == args[2]:
+                            return user['id']
+                    return False
+                if method == 'version':
+                    return {'server_version': '10.0'}
+            if service == 'object' and method == 'execute_kw':
+                self.last_key = '{}.{}'.format(args[3], args[4])
+                return odoo.execute_kw(args[3], args[4], args[5],
+                                       args[6] if len(args) > 6 else {})
+            self.last_key = '{}.{}'.format(service, method)
+            raise xmlrpc.client.Fault(4, 'Servicio desconocido')
+
+    return Handler
+
+
+def serve(odoo, latency=0.0, port=0):
+    """
+    Arranca en un hilo el servidor falso en 127.0.0.1 (port 0: uno libre)
+    """
+    counters = Counters()
+    httpd = ThreadingHTTPServer(('127.0.0.1', port),
+                                make_handler(odoo, counters, latency))
+    httpd.daemon_threads = True
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    return httpd, counters
+
+
+BENCH_USER = 'user0@example.com'
+BENCH_PASSWORD = 'x'
+
+
+def report_scenarios(odoocli, month, year, path):
+    """
+    Informes que se miden: (nombre, función, presupuesto de RPC). El
+    presupuesto depende del número de empleados porque las consultas
+    masivas se hacen por bloques de ATTENDANCE_CHUNK.
+    """
+    def blocks(employees):
+        return -(-employees // odoocli.ATTENDANCE_CHUNK)
+
+    return (
+        ('show_resume_now', lambda login: odoocli.show_resume_now(login),
+         lambda employees: 8),
+        ('year_summary', lambda login: odoocli.year_summary(login),
+         lambda employees: 8),
+        # El resumen sale de un read_group y el listado se descarga aparte,
+        # por páginas, sin cargar el mes en memoria
+        ('list_to_csv', lambda login: odoocli.list_to_csv(
+            login, os.path.join(path, 'list.csv'), month, year),
+         lambda employees: 9),
+        ('bulk', lambda login: odoocli.bulk(
+            login, None, odoocli.show_resume, month, year),
+         lambda employees: 7 + 2 * blocks(employees)),
+        ('bulk year_summary', lambda login: odoocli.bulk(
+            login, None, odoocli.year_summary, month, year),
+         lambda employees: 9 + 3 * blocks(employees)),
+        ('org', lambda login: odoocli.org_summary_to_screen(
+            login, None, month, year),
+         lambda employees: 8 + blocks(employees)),
+    )
+
+
+def run_reports(employees, latency, rpc):
+    """
+    Ejecuta cada informe con las cachés de odoocli vacías (se recarga el
+    módulo) contra un Odoo falso. Retorna una fila por informe:
+    (nombre, segundos, llamadas, presupuesto, bytes enviados, bytes
+    recibidos).
+    """
+    odoo = FakeOdoo(employees)
+    httpd, counters = serve(odoo, latency)
+    os.environ['ODOOCLIHOST'] = 'http://127.0.0.1:{}'.format(
+        httpd.server_port)
+    os.environ['ODOOCLIDATABASE'] = 'bench'
+    os.environ['ODOOCLI_RPC'] = rpc
+    sys.modules.pop('odoocli', None)
+    odoocli = importlib.import_module('odoocli')
+
+    month, year = odoo.today.month - 1, odoo.today.year
+    if month == 0:
+        month, year = 12, year - 1
+    rows = []
+    with tempfile.TemporaryDirectory() as path:
+        for name, func, budget in report_scenarios(odoocli, month, year,
+                                                    path):
+            odoocli = importlib.reload(odoocli)
+            uid = odoocli.common_proxy().authenticate(
+                odoocli.db, BENCH_USER, BENCH_PASSWORD, {})
+            login = {'db': odoocli.db, 'password': BENCH_PASSWORD,
+                     'username': BENCH_USER, 'uid': uid,
+                     'conn': odoocli.object_proxy()}
+            counters.reset()
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                func(login)
+            elapsed = time.perf_counter() - start
+            rows.append((name, elapsed, counters.calls, budget(employees),
+                         counters.bytes_in, counters.bytes_out))
+    httpd.shutdown()
+    return rows
+
+
+def print_reports(rows, employees, latency):
+    print('{} empleados, {:.0f} ms de latencia'.format(employees,
+                                                       latency * 1000))
+    print('Informe           | Tiempo     | RPC  | Máx. | Enviado    | '
+          'Recibido')
+    for name, seconds, calls, budget, sent, received in rows:
+        print('{:17} | {:7.0f} ms | {:4} | {:4} | {:10} | {:10}{}'.format(
+            name, seconds * 1000, calls, budget, sent, received,
+            '  <-- supera el presupuesto' if calls > budget else ''))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=help_text,
+        epilog=epilog_text)
+    parser.add_argument('mode', choices=('codecs', 'reports'), nargs='?',
+                        default='codecs',
+                        help='Prueba que se ejecutará')
+    parser.add_argument('--rows', type=int, default=20000,
+                        help='Número de asistencias sintéticas')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Repeticiones de cada medida (se toma la mejor)')
+    parser.add_argument('--live', action='count',
+                        help='Usa las asistencias reales del usuario en lugar \
+                        de datos sintéticos')
+    parser.add_argument('--employees', type=int, default=50,
+                        help='Número de empleados del Odoo falso (reports)')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='Milisegundos que espera el Odoo falso antes de \
+                        cada respuesta (reports)')
+    parser.add_argument('--rpc', choices=('xmlrpc', 'jsonrpc'),
+                        default='xmlrpc',
+                        help='Protocolo con el que odoocli habla con el Odoo \
+                        falso (reports)')
+    args = parser.parse_args()
+
+    if args.mode == 'reports':
+        results = run_reports(args.employees, args.latency / 1000, args.rpc)
+        print_reports(results, args.employees, args.latency / 1000)
+        if any(calls > budget for name, seconds, calls, budget, sent, received
+               in results):
+            sys.exit('Algún informe supera su presupuesto de llamadas RPC')
+    else:
+        if args.live:
+            dataset = live_attendance()
+        else:
+            dataset = synthetic_attendance(args.rows)
+        print_codecs(compare_codecs(dataset, args.repeat), len(dataset))
@@ -4,7 +4,6 @@ import argparse
 import getpass
 import os
 import sys
-import xmlrpc.client
 
 import odoocli
 
@@ -28,13 +27,20 @@ total de ese mes. Se puede concretar el año con la opción --year.
 --month admite números negativos. En ese caso, el número se restará del
 mes actual, de modo que "-m -1" mostrará el mes anterior al corriente. 
 
+Con --org se muestra, en lugar de un informe por usuario, una sola tabla con
+una fila por usuario y mes (desde enero si se usa --accumulated). Se calcula
+con muy pocas consultas a Odoo, así que sirve para miles de usuarios. Con
+--file la tabla se guarda en ese archivo en formato CSV. Las sesiones
+abiertas no se cuentan.
+
 Si se usa el flag --list se mostrará un listado de asistencias en lugar del
 resumen.
 
 Con --file NOMBRE_DE ARCHIVO se guarará el listado de asistencias en un archivo
 en formato CSV por cada usuario. El nombre de cada uno de los archivos creados
 será "usuario-NOMBRE_DE ARCHIVO", donde "usuario" es el nombre extraído del
-correo electrónico de cada usaurio. 
+correo electrónico de cada usaurio. Si el nombre termina en .gz los archivos
+se guardan comprimidos con gzip.
 
 Si existen las variables de entorno "ODOOCLIUSER" y "ODOOCLIPASS", se usarán
 para el login en Odoo a menos que se indique un usuario con el argumento
@@ -79,9 +85,74 @@ parser.add_argument('-e', '--email', nargs='*',
 parser.add_argument('-a', '--accumulated', action='count',
                     help='Muestra un resumen de todos los meses desde \
                     enero en lugar del resumen habitual')
-
+parser.add_argument('-o', '--org', action='count',
+                    help='Muestra una sola tabla con el resumen de todos los \
+                    usuarios, una fila por usuario y mes')
+parser.add_argument('-j', '--jobs', type=int, default=1,
+                    help='Número de usuarios que se procesan en paralelo, \
+                    cada uno con su propia conexión (por defecto 1)')
+parser.add_argument('--no-cache', action='count',
+                    help='No usa la caché local de periodos cerrados')
+parser.add_argument('--refresh', action='count',
+                    help='Vuelve a descargar los periodos cerrados y \
+                    actualiza la caché local')
+parser.add_argument('--sync', action='count',
+                    help='Antes de los informes, trae de Odoo sólo los \
+                    cambios hechos desde la última sincronización y \
+                    los aplica sobre los periodos guardados en la caché \
+                    local, sin volver a descargarlos')
+parser.add_argument('--rpc', choices=('xmlrpc', 'jsonrpc'),
+                    default=odoocli.rpc_backend,
+                    help='Protocolo para hablar con Odoo (por defecto el de \
+                    la variable de entorno "ODOOCLI_RPC" o xmlrpc)')
+
+parser.add_argument('--outbox', type=str,
+                    help='Con --send, guarda los correos ya compuestos en la \
+                    carpeta OUTBOX en lugar de enviarlos (se envían después \
+                    con --deliver)')
+parser.add_argument('--deliver', type=str, metavar='OUTBOX',
+                    help='Envía los correos pendientes de la carpeta OUTBOX, \
+                    con reintentos, y termina (no necesita login en Odoo)')
+parser.add_argument('--once', action='count',
+                    help='Con --deliver, hace una sola pasada sin esperar a \
+                    los reintentos (los que fallen quedan pendientes para la \
+                    siguiente; para lanzarlo desde cron)')
+
+parser.add_argument('--profile', action='count',
+                    help='Al terminar muestra (por stderr) cuántas llamadas \
+                    RPC se han hecho, su tiempo total y p95 y sus bytes, por \
+                    modelo y método y por función')
+parser.add_argument('--trace', type=str, metavar='FILE',
+                    help='Guarda todas las llamadas RPC en FILE, una por \
+                    línea en JSON')
+parser.add_argument('--record', type=str, metavar='FILE',
+                    help='Graba en FILE todas las llamadas a Odoo y sus \
+                    respuestas (sin contraseñas), para reproducirlas \
+                    después con --replay. No usa la caché local')
+parser.add_argument('--replay', type=str, metavar='FILE',
+                    help='Responde a las llamadas con las grabadas en FILE \
+                    con --record, sin conectar con Odoo. No usa la caché \
+                    local')
 args = parser.parse_args()
 
+if args.deliver:
+    sent, dead, pending = odoocli.deliver_outbox(args.deliver,
+                                                 wait=not args.once)
+    print('Enviados: {}, descartados: {}, pendientes: {}'.format(
+        sent, dead, pending))
+    sys.exit(1 if dead or (pending and not args.once) else 0)
+
+odoocli.rpc_backend = args.rpc
+
+if args.profile or args.trace:
+    odoocli.start_profile(bool(args.profile), args.trace)
+
+if args.record or args.replay:
+    odoocli.start_cassette(args.replay or args.record, bool(args.replay))
+
+if not args.no_cache and not (args.record or args.replay):
+    odoocli.disk_cache = odoocli.open_disk_cache(bool(args.refresh))
+
 if args.user:
     username = args.user
     password = getpass.getpass()
@@ -95,14 +166,13 @@ else:
     username = input('Username: ')
     password = getpass.getpass()
 
-common = xmlrpc.client.ServerProxy('{}/xmlrpc/2/common'.format(odoocli.server))
+common = odoocli.common_proxy()
 uid = common.authenticate(odoocli.db, username, password, {})
 
 if uid:
     login_data = {'db': odoocli.db, 'password': password, 'username': username,
                   'uid': uid,
-                  'conn': xmlrpc.client.ServerProxy(
-                      '{}/xmlrpc/2/object'.format(odoocli.server))}
+                  'conn': odoocli.object_proxy()}
 else:
     sys.exit('Error en el Login')
 
@@ -111,39 +181,63 @@ if args.email:
 else:
     mails = None
 
+if args.sync:
+    print('Periodos actualizados:', odoocli.sync_disk_cache(
+        login_data,
+        odoocli.get_employee_ids(login_data,
+                                 mails or odoocli.get_mail_users(login_data))))
+
 current_month, current_year = odoocli.get_args_date(args.month, args.year)
 
-if args.file:
+if args.org:
+    if args.file:
+        odoocli.org_summary_to_csv(login_data, args.file, mails,
+                                   current_month, current_year,
+                                   bool(args.accumulated))
+    else:
+        odoocli.org_summary_to_screen(login_data, mails, current_month,
+                                      current_year, bool(args.accumulated))
+elif args.file:
     if args.accumulated:
         odoocli.bulk(login_data, mails, odoocli.accumulated_list_to_csv,
                      args.file,
-                     current_month, current_year)
+                     current_month, current_year, jobs=args.jobs)
     else:
         odoocli.bulk(login_data, mails, odoocli.list_to_csv, args.file,
-                     current_month, current_year)
+                     current_month, current_year, jobs=args.jobs)
 elif args.send:
+    if args.outbox:
+        odoocli.mail_outbox = odoocli.Outbox(args.outbox)
+    odoocli.mail_pool = odoocli.open_mail_pool()
     if args.accumulated:
         odoocli.bulk(login_data, mails, odoocli.mail_report_accumulated,
                      current_month,
-                     current_year)
+                     current_year, jobs=args.jobs)
     else:
         odoocli.bulk(login_data, mails, odoocli.mail_report_list,
                      current_month,
-                     current_year)
+                     current_year, jobs=args.jobs)
+    failures = odoocli.mail_pool.close()
+    for mail_to, error in failures:
+        print('Error enviando el correo a', mail_to, ':', error,
+              file=sys.stderr)
+    if failures:
+        sys.exit('{} correos sin enviar'.format(len(failures)))
 elif args.list:
     odoocli.bulk(login_data, mails, odoocli.list_to_screen, current_month,
-                 current_year)
+                 current_year, jobs=args.jobs)
 else:
     if args.month:
         if args.accumulated:
             odoocli.bulk(login_data, mails, odoocli.year_summary,
-                         current_month, current_year)
+                         current_month, current_year, jobs=args.jobs)
         else:
             odoocli.bulk(login_data, mails, odoocli.show_resume, current_month,
-                         current_year)
+                         current_year, jobs=args.jobs)
     else:
         if args.accumulated:
-            odoocli.bulk(login_data, mails, odoocli.year_summary, None, None)
+            odoocli.bulk(login_data, mails, odoocli.year_summary, None, None,
+                         jobs=args.jobs)
         else:
             odoocli.bulk(login_data, mails, odoocli.show_resume_now, None,
-                         None)
+                         None, jobs=args.jobs)